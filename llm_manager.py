@@ -1,7 +1,12 @@
 import os
+import glob
 import json
+import time
 import openai
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from dotenv import load_dotenv
 
 # Import LLM classes
@@ -16,6 +21,7 @@ from llms.aohybridorchestrator import AOHybridOrchestrator
 from llms.openairealtime import OpenaiRealtime
 from llms.openairealorchestrator import OpenaiRealOrchestrator
 from llms.azure_glean_orchestrator import GleanOrchestrator
+from llms.message_bus import MessageBus
 
 class LLMManager:
     def __init__(self, config_path='llm_config.json'):
@@ -27,46 +33,110 @@ class LLMManager:
             config = json.load(f)
 
         self.llms = {}
+        self.llm_configs = {}
+        self.llm_locks = {}
         self.llm_links = {}
         self.async_llms = set()  # Track which LLMs are async
+        self.message_bus = MessageBus()  # Pushes extra messages to connected browsers
+        self.warm_up_enabled = os.getenv('LLM_WARM_UP', 'true').lower() == 'true'
+        self.warm_up_workers = int(os.getenv('LLM_WARM_UP_WORKERS', '4'))
+        self.delete_workers = int(os.getenv('ASSISTANT_DELETE_WORKERS', '8'))
+        self.delete_retries = 3
+        self.delete_backoff = 1.0
 
-        # Clean up existing assistants if needed
-        self._cleanup_assistants()
+        # Take ownership of assistants left over from the last run; they are deleted in the background
+        self.cleanup_lock = threading.Lock()
+        self.stale_assistants = self._claim_assistants()
         
-        # Initialize LLMs
+        # Register LLMs; instances are created on first use or during warm-up
         self._initialize_llms(config)
 
-    def _cleanup_assistants(self):
-        # Handle OpenAI assistants cleanup
-        if os.path.exists('openai_assistants.txt'):
-            client = openai.Client(api_key=os.getenv('OPENAI_API_KEY'))
-            self._delete_assistants('openai_assistants.txt', client)
+    def _claim_assistants(self):
+        """Move the assistant id files aside so assistants created from now on are tracked separately.
 
-        # Handle Azure OpenAI assistants cleanup
-        if os.path.exists('azure_openai_assistants.txt'):
-            client = openai.AzureOpenAI(
+        Each file is renamed to a .pending file that is only removed once cleanup has finished, so ids
+        survive a crash before then. Pending files left by an earlier run are claimed too.
+        """
+        claimed = {}
+        for provider, file_path in [('openai', 'openai_assistants.txt'), ('azure', 'azure_openai_assistants.txt')]:
+            if os.path.exists(file_path):
+                os.replace(file_path, f"{file_path}.{os.getpid()}.{time.time_ns()}.pending")
+            pending_files = sorted(glob.glob(f"{glob.escape(file_path)}.*.pending"))
+            if not pending_files:
+                continue
+            assistant_ids = []
+            for pending_file in pending_files:
+                with open(pending_file, 'r') as f:
+                    assistant_ids.extend(line.strip() for line in f if line.strip())
+            claimed[provider] = {'ids': list(dict.fromkeys(assistant_ids)), 'files': pending_files}
+        return claimed
+
+    def _assistant_client(self, provider):
+        if provider == 'azure':
+            return openai.AzureOpenAI(
                 api_key=os.getenv('AZURE_OPENAI_API_KEY'),
                 api_version=os.getenv('AZURE_OPENAI_API_VERSION'),
                 azure_endpoint=os.getenv('AZURE_OPENAI_API_ENDPOINT')
             )
-            self._delete_assistants('azure_openai_assistants.txt', client)
+        return openai.Client(api_key=os.getenv('OPENAI_API_KEY'))
 
-    def _delete_assistants(self, file_path, client):
-        with open(file_path, 'r') as f:
-            assistant_ids = f.readlines()
+    def _cleanup_assistants(self, claimed=None):
+        # Handle OpenAI and Azure OpenAI assistants cleanup; a shutdown cleanup waits for the startup one
+        with self.cleanup_lock:
+            self._cleanup_claimed_assistants(self._claim_assistants() if claimed is None else claimed)
 
-        for assistant_id in assistant_ids:
-            assistant_id = assistant_id.strip()
+    def _cleanup_claimed_assistants(self, claimed):
+        for provider, pending in claimed.items():
+            try:
+                failed = self._delete_assistants(pending['ids'], self._assistant_client(provider))
+            except Exception as e:
+                print(f"Error cleaning up {provider} assistants: {e}")
+                failed = pending['ids']
+            try:
+                if failed:
+                    # Record assistants that couldn't be deleted so the next cleanup retries them
+                    file_path = 'azure_openai_assistants.txt' if provider == 'azure' else 'openai_assistants.txt'
+                    with open(file_path, 'a') as f:
+                        f.writelines(f"{assistant_id}\n" for assistant_id in failed)
+                # Every claimed id is now deleted or recorded again, so the pending files can go
+                for pending_file in pending['files']:
+                    os.remove(pending_file)
+            except Exception as e:
+                print(f"Error recording {provider} assistants, keeping {pending['files']}: {e}")
+
+    def _delete_assistant(self, assistant_id, client):
+        """Delete one assistant, retrying with backoff. Returns True if it is gone."""
+        for attempt in range(self.delete_retries):
             try:
                 response = client.beta.assistants.delete(assistant_id)
-                if response.deleted:
-                    print(f"Assistant {assistant_id} deleted.")
-                else:
-                    print(f"Assistant {assistant_id} not deleted.")
+                return response.deleted
+            except openai.NotFoundError:
+                # Already deleted
+                return True
             except Exception as e:
-                print(f"Error deleting Assistant {assistant_id}: {e}")
+                if attempt == self.delete_retries - 1:
+                    print(f"Error deleting Assistant {assistant_id}: {e}")
+                    return False
+                time.sleep(self.delete_backoff * (2 ** attempt))
+        return False
+
+    def _delete_assistants(self, assistant_ids, client):
+        """Delete assistants concurrently and return the ids that could not be deleted."""
+        total = len(assistant_ids)
+        if total == 0:
+            return []
 
-        os.remove(file_path)
+        failed = []
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.delete_workers) as executor:
+            futures = {executor.submit(self._delete_assistant, assistant_id, client): assistant_id for assistant_id in assistant_ids}
+            for future in as_completed(futures):
+                done += 1
+                if not future.result():
+                    failed.append(futures[future])
+                if done % 50 == 0 or done == total:
+                    print(f"Deleted {done - len(failed)}/{total} assistants ({len(failed)} failed)")
+        return failed
 
     def _initialize_llms(self, config):
         for name, llm_config in config['llms'].items():
@@ -75,24 +145,61 @@ class LLMManager:
             
             # Replace environment variable placeholders with actual values
             for key, value in params.items():
-                if value in os.environ:
+                if isinstance(value, str) and value in os.environ:
                     params[key] = os.getenv(value)
             
-            # Get the class reference
-            llm_class = globals()[class_name]
-            
-            # Create instance and store it
-            llm_instance = llm_class(**params)
-            self.llms[name] = llm_instance
+            self.llm_configs[name] = (class_name, params)
+            self.llm_locks[name] = threading.Lock()
             self.llm_links[name] = params['info_link']
             
             # Track if this is an async LLM
             if class_name in ["OpenaiRealtime", "OpenaiRealOrchestrator"]:
                 self.async_llms.add(name)
 
+    def _create_llm(self, name):
+        class_name, params = self.llm_configs[name]
+
+        # Get the class reference
+        llm_class = globals()[class_name]
+        
+        # Create instance
+        llm_instance = llm_class(**params)
+
+        # Push extra messages to subscribers as soon as the LLM adds them
+        if hasattr(llm_instance, 'extra_messages'):
+            llm_instance.extra_messages.listener = partial(self.message_bus.publish, name)
+        return llm_instance
+
+    def warm_up(self):
+        """Create all LLM instances in parallel so first requests don't pay the construction cost."""
+        def load(name):
+            try:
+                self.get_llm(name)
+            except Exception as e:
+                print(f"Error initializing LLM {name}: {e}")
+
+        with ThreadPoolExecutor(max_workers=self.warm_up_workers) as executor:
+            list(executor.map(load, self.llm_configs))
+        print("LLM warm-up completed")
+
+    async def start_background_tasks(self):
+        """Delete stale assistants and optionally warm up LLMs without delaying server start."""
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, self._cleanup_assistants, self.stale_assistants)
+        self.stale_assistants = {}
+        if self.warm_up_enabled:
+            loop.run_in_executor(None, self.warm_up)
+
+    async def load_llm(self, name):
+        """Get an LLM, creating it on a worker thread if it hasn't been created yet."""
+        if name in self.llms or name not in self.llm_configs:
+            return self.llms.get(name)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_llm, name)
+
     async def get_llm_response(self, llm_name, user, prompt):
         """Get a response from an LLM, handling both sync and async LLMs."""
-        llm = self.llms.get(llm_name)
+        llm = await self.load_llm(llm_name)
         if not llm:
             return None
             
@@ -105,11 +212,56 @@ class LLMManager:
             loop = asyncio.get_event_loop()
             return await loop.run_in_executor(None, llm.generate, user, prompt)
 
+    async def get_llm_response_stream(self, llm_name, user, prompt):
+        """Stream a response from an LLM as text chunks, handling both sync and async LLMs."""
+        llm = await self.load_llm(llm_name)
+        if not llm:
+            return
+
+        if llm_name in self.async_llms:
+            # Handle async LLM
+            async for chunk in llm.generate_stream(user, prompt):
+                yield chunk
+        elif hasattr(llm, 'generate_stream'):
+            # Handle synchronous LLM
+            # Run the generator in an executor and hand chunks back to the event loop
+            loop = asyncio.get_event_loop()
+            queue = asyncio.Queue()
+
+            def produce():
+                try:
+                    for chunk in llm.generate_stream(user, prompt):
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                except Exception as e:
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, None)
+
+            loop.run_in_executor(None, produce)
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        else:
+            # LLMs without streaming support return the whole response as one chunk
+            yield await self.get_llm_response(llm_name, user, prompt)
+
     def get_llm(self, name):
-        return self.llms.get(name)
+        llm = self.llms.get(name)
+        if llm is None and name in self.llm_configs:
+            # Create the LLM on first use; the lock stops two threads building the same one
+            with self.llm_locks[name]:
+                llm = self.llms.get(name)
+                if llm is None:
+                    llm = self._create_llm(name)
+                    self.llms[name] = llm
+        return llm
 
     def get_available_llms(self):
-        return list(self.llms.keys())
+        return list(self.llm_configs.keys())
 
     def get_llm_links(self):
         return self.llm_links
@@ -118,7 +270,7 @@ class LLMManager:
         """Get a set of all active users across all LLMs"""
         active_users = set()
         
-        for llm in self.llms.values():
+        for llm in list(self.llms.values()):
             # Check conversation history
             if hasattr(llm, 'conversation_history'):
                 active_users.update(llm.conversation_history.keys())
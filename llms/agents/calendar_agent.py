@@ -105,6 +105,8 @@ class AzureCalAgent(AzureMulti):
         super().__init__(api_key=api_key,model=model,endpoint=endpoint,version=version,info_link=info_link,type=type,wait_limit=wait_limit,agent_name=agent_name)
 
         self.outlook365_clients = {}
+        # Outlook tools share the user's client, so run them in order
+        self.tool_groups = {"search_calendar_events": "outlook", "check_room_availability": "outlook", "check_person_availability": "outlook"}
 
         self.agent_instructions = """
         You are a specialized agent that keeps track of calendars.
@@ -159,7 +161,7 @@ class AzureCalAgent(AzureMulti):
                     "properties": {
                         "room_email": {
                         "type": "string",
-                        "description": "Email address of the room to check availability for."
+                        "description": "Email address of the room to check availability for. Separate several addresses with commas to check them all at once."
                         },
                         "start_date": {
                         "type": "string",
@@ -183,7 +185,7 @@ class AzureCalAgent(AzureMulti):
                     "properties": {
                         "person_email": {
                         "type": "string",
-                        "description": "Email address of the person to check availability for."
+                        "description": "Email address of the person to check availability for. Separate several addresses with commas to check them all at once."
                         },
                         "start_date": {
                         "type": "string",
@@ -56,15 +56,9 @@ class AzureJiraAgent(AzureMulti):
         if tool_name == "jira_search":
             if debug: print(f"Searching JIRA: {args['JQL']}")
             jira_info = ""
-            jira_data = self.jira_search.search(args['JQL'], num_results=100)
-            if jira_data is None:
-                results = "No search results found"
-            else:
-                # Get each link and page text from the search results
-                for ticket_text in jira_data:
-                    #append the link and page test
-                    jira_info += f"Page Text: {ticket_text}\n"
-                results = f'Your search to answer the question produced the following results:\n{jira_info}'
+            # Issue pages are fetched only until the prompt budget is filled
+            jira_info = self.jira_search.search_text(args['JQL'], num_results=100, label='Page Text')
+            results = f'Your search to answer the question produced the following results:\n{jira_info}'
         elif tool_name == "date_time":
             if debug: print(f"Getting the date and time")
             results = f"The current date and time is: {datetime.datetime.now()}"
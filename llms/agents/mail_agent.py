@@ -12,11 +12,15 @@ class OpenAIMailAgent(OpenaiMulti):
         super().__init__(api_key,model,info_link,wait_limit,type)
 
         self.gmail_clients = {}
+        # Gmail tools share the user's client and may depend on each other, so run them in order
+        self.tool_groups = {name: "gmail" for name in ["gmail_search", "gmail_mail_details", "gmail_mark_as_read", "gmail_archive", "gmail_label",
+                                                        "gmail_delete", "gmail_list_labels", "gmail_create_label"]}
 
         self.agent_instructions = """
         You are a specialized agent that can search user mail for information.
         As this is your primary job, you will always use all the mail tools to search for information.
         When dealing with Labels, always use the gmail_list_labels tool to ensure you are using the correct label ID.
+        Only use the gmail_mail_details tool if you need the full body of a specific email.
         If you don't find what you need, try using the mail search tools again.
         Verify the information you find is accurate and relevant prior to responsing to the user.
         """
@@ -40,6 +44,22 @@ class OpenAIMailAgent(OpenaiMulti):
                 }
             },{
             "type": "function",
+            "function": {
+                    "name": "gmail_mail_details",
+                    "description": "Get the full details of an e-mail in Gmail.",
+                    "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "message_id": {
+                        "type": "string",
+                        "description": "The message ID of the email to get details for. Separate several IDs with commas to get them all at once."
+                        }
+                    },
+                    "required": ["message_id"]
+                    }
+                }
+            },{
+            "type": "function",
             "function": {
                     "name": "gmail_mark_as_read",
                     "description": "Mark an email as read in Gmail.",
@@ -165,13 +185,23 @@ class OpenAIMailAgent(OpenaiMulti):
             gmail_data = self.gmail_clients[user].search_emails(args['search_string'], 20)
 
             if gmail_data:
-                for msg in gmail_data:
-                    msg_details += self.gmail_clients[user].get_email_details(msg['id'])
+                # Subjects, senders and snippets for every result in a few batched requests
+                msg_details = '\n'.join(self.gmail_clients[user].get_emails_details([msg['id'] for msg in gmail_data]))
             
             if msg_details:
                 return msg_details
             else:
                 return 'No messages found.'
+        elif tool_name == "gmail_mail_details":
+            if user not in self.gmail_clients:
+                try:
+                    self.gmail_clients[user] = GmailClient(user)
+                except Exception as e:
+                    return f"An error occurred: {e}"
+            if debug: print(f"Getting email details: {args['message_id']}")
+            message_ids = [message_id.strip() for message_id in args['message_id'].split(',') if message_id.strip()]
+            msg_details = '\n'.join(self.gmail_clients[user].get_emails_details(message_ids, format='full'))
+            return msg_details or 'No messages found.'
         elif tool_name == "gmail_mark_as_read": 
             if user not in self.gmail_clients:
                 try:
@@ -240,6 +270,8 @@ class AzureMailAgent(AzureMulti):
         super().__init__(api_key=api_key, model=model, endpoint=endpoint, version=version, info_link=info_link, wait_limit=wait_limit, type=type, agent_name=agent_name)
 
         self.outlook365_clients = {}
+        # Outlook tools share the user's client, so run them in order
+        self.tool_groups = {"outlook_search": "outlook", "outlook_mail_details": "outlook"}
 
         self.agent_instructions = """
         You are a specialized agent that can search user mail for information.
@@ -292,7 +324,7 @@ class AzureMailAgent(AzureMulti):
                     "properties": {
                         "email_id": {
                         "type": "string",
-                        "description": "The ID of the e-mail to get details for."
+                        "description": "The ID of the e-mail to get details for. Separate several IDs with commas to get them all at once."
                         }
                     },
                     "required": ["email_id"]
@@ -350,7 +382,9 @@ class AzureMailAgent(AzureMulti):
                 except Exception as e:
                     return f"An error occurred: {e}"
             if debug: print(f"Getting email details: {args['email_id']}")
-            email_details = self.outlook365_clients[user].get_email_details(args['email_id'])
+            # Several IDs are fetched in one batched request
+            email_ids = [email_id.strip() for email_id in args['email_id'].split(',') if email_id.strip()]
+            email_details = '\n'.join(str(details) for details in self.outlook365_clients[user].get_emails_details(email_ids))
             results = email_details
         elif tool_name == "date_time":
             if debug: print(f"Getting the date and time")
@@ -28,6 +28,9 @@ class AOHybridOrchestrator(AzureMulti):
         self.llama3_agent = OllamaMulti('llama3.1:latest')
         self.weather_checker = WeatherChecker(openweathermap_key)
 
+        # These tools all use the llama3_agent, so they must not run concurrently
+        self.tool_groups = {"agent_writer": "llama3_agent", "agent_researcher": "llama3_agent", "agent_mathmatician": "llama3_agent"}
+
         self.agent_instructions = """
         You are an orchestrator agent. You should maximize the use of the tools available to you.
         Use the get_weather and get_forcast tools to check the current weather, temperature and forecast for a location.
@@ -0,0 +1,32 @@
+import hashlib
+import json
+import threading
+
+class AssistantRegistry:
+    """Shares one assistant per identical definition across all users of an agent."""
+    def __init__(self):
+        self.assistants = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def key(self, agent, client):
+        """Key an assistant by agent class, endpoint, model and a hash of its full definition."""
+        definition = json.dumps({
+            'api_key': client.api_key,
+            'name': agent.assistant_name,
+            'instructions': agent.agent_instructions,
+            'tools': agent.tools
+        }, sort_keys=True, default=str)
+        return (type(agent).__name__, str(client.base_url), agent.model, hashlib.sha256(definition.encode()).hexdigest())
+
+    def get_assistant(self, key, create):
+        """Return the assistant for a key, calling create() the first time it is needed."""
+        with self.lock:
+            key_lock = self.locks.setdefault(key, threading.Lock())
+        # Only one thread creates a given assistant; others wait and reuse it
+        with key_lock:
+            if key not in self.assistants:
+                self.assistants[key] = create()
+            return self.assistants[key]
+
+assistant_registry = AssistantRegistry()
@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, TimeoutError
+
+class AssistantToolRunner:
+    """Runs the tool calls of an Assistants API run step; shared by OpenaiMulti and AzureMulti.
+
+    Uses the class's handle_tool, tool_workers, tool_timeout and tool_groups.
+    """
+    def run_tool_call(self, user, tool_call):
+        try:
+            return self.handle_tool(user, tool_call)
+        except:
+            return "Error processing tool"
+
+    def run_tool_calls(self, user, tool_calls):
+        # Calls sharing an agent (see tool_groups) run in order; separate groups run concurrently
+        groups = {}
+        for each_tool_call in tool_calls:
+            group = self.tool_groups.get(each_tool_call.function.name, each_tool_call.function.name)
+            groups.setdefault(group, []).append(each_tool_call)
+
+        outputs = {}
+        def run_group(group, group_calls):
+            self.wait_for_overrun(user, group)
+            for each_tool_call in group_calls:
+                outputs[each_tool_call.id] = self.run_tool_call(user, each_tool_call)
+
+        if len(tool_calls) == 1:
+            run_group(*next(iter(groups.items())))
+        else:
+            executor = ThreadPoolExecutor(max_workers=min(self.tool_workers, len(groups)))
+            futures = {group: executor.submit(run_group, group, group_calls) for group, group_calls in groups.items()}
+            wait(futures.values(), timeout=self.tool_timeout)
+            # Groups that haven't started are cancelled; ones still running are tracked so the
+            # next call for the group waits for them instead of overlapping on the agent's thread
+            executor.shutdown(wait=False, cancel_futures=True)
+            for group, future in futures.items():
+                if not future.done():
+                    print(f'Tool group {group} for {user} overran {self.tool_timeout} seconds and is still running')
+                    with self.tool_overruns_lock:
+                        self.tool_overruns[(user, group)] = future
+
+        tool_outputs = []
+        for each_tool_call in tool_calls:
+            tool_outputs.append(
+                {
+                    "tool_call_id": each_tool_call.id,
+                    "output": outputs.get(each_tool_call.id, f"Tool timed out after {self.tool_timeout} seconds")
+                }
+            )
+        return tool_outputs
+
+    def wait_for_overrun(self, user, group):
+        # A group that overran an earlier step may still be posting to its agent's thread
+        with self.tool_overruns_lock:
+            future = self.tool_overruns.get((user, group))
+        if future is None:
+            return
+        try:
+            future.result(timeout=self.tool_timeout)
+        except TimeoutError:
+            print(f'Tool group {group} for {user} is still running, continuing anyway')
+            return
+        except Exception:
+            pass
+        with self.tool_overruns_lock:
+            if self.tool_overruns.get((user, group)) is future:
+                del self.tool_overruns[(user, group)]
@@ -34,6 +34,9 @@ class AzureOrchestrator(AzureMulti):
         self.math_agent = OllamaMulti('llama3.1:latest')
         self.weather_checker = WeatherChecker(openweathermap_key)
 
+        # These tools all use the azure_agent, so they must not run concurrently
+        self.tool_groups = {"agent_writer": "azure_agent", "agent_researcher": "azure_agent"}
+
         # Response token size for agents
         self.azure_agent.token_run_size = 3000
         self.confluence_agent.token_run_size = 3000
@@ -1,4 +1,6 @@
-import requests
+import json
+from llms.tools.http_client import http_client
+from llms.message_bus import ExtraMessages
 
 class ClaudeMulti():
     def __init__(self, api_key, api_base_url='https://api.anthropic.com', model='claude-3-5-sonnet-20240620',info_link=''):
@@ -10,7 +12,7 @@ class ClaudeMulti():
             'anthropic-version': '2023-06-01'
         }
         self.conversation_history = {}
-        self.extra_messages = {}
+        self.extra_messages = ExtraMessages()
         self.info_link = info_link
         self.agent_instructions = ''
 
@@ -37,7 +39,7 @@ class ClaudeMulti():
         if stop_sequences:
             payload['stop_sequences'] = stop_sequences
 
-        response = requests.post(
+        response = http_client.post(
             f'{self.api_base_url}/v1/messages',
             headers=self.headers,
             json=payload
@@ -55,6 +57,56 @@ class ClaudeMulti():
         else:
             response.raise_for_status()
 
+    def generate_stream(self, user, prompt, max_tokens=2000, stop_sequences=None, temperature=1.0):
+
+        # Check if the user has a conversation history and create one if not
+        if user not in self.conversation_history:
+            self.conversation_history[user] = []
+
+        # Append the new user prompt to the conversation history
+        self.conversation_history[user].append({
+            'role': 'user',
+            'content': prompt
+        })
+
+        payload = {
+            'model': self.model,
+            'system' : self.agent_instructions,
+            'messages': self.conversation_history[user],  # Use the conversation history
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'stream': True
+        }
+
+        if stop_sequences:
+            payload['stop_sequences'] = stop_sequences
+
+        response = http_client.post(
+            f'{self.api_base_url}/v1/messages',
+            headers=self.headers,
+            json=payload,
+            stream=True
+        )
+        response.raise_for_status()
+
+        # Read the server-sent events, yielding each text delta as it arrives
+        assistant_message = ''
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data: '):
+                continue
+            event = json.loads(line[len('data: '):])
+            if event.get('type') == 'content_block_delta' and event['delta'].get('type') == 'text_delta':
+                assistant_message += event['delta']['text']
+                yield event['delta']['text']
+            elif event.get('type') == 'error':
+                raise Exception(event['error'].get('message', 'Stream error'))
+
+        # Append the assistant's response to the conversation history
+        self.conversation_history[user].append({
+            'role': 'assistant',
+            'content': assistant_message
+        })
+
     def get_extra_messages(self, user):
         if user not in self.extra_messages:
             self.extra_messages[user] = []  # Initialize the list if the key doesn't exist
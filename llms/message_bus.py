@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+class MessageBus:
+    """Pushes extra messages (tool progress etc.) to the per-user queues of connected listeners."""
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, user):
+        """Register a listener for a user and return its queue."""
+        queue = asyncio.Queue()
+        with self.lock:
+            self.subscribers.setdefault(user, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user, queue):
+        """Remove a listener's queue."""
+        with self.lock:
+            listeners = [entry for entry in self.subscribers.get(user, []) if entry[1] is not queue]
+            if listeners:
+                self.subscribers[user] = listeners
+            else:
+                self.subscribers.pop(user, None)
+
+    def publish(self, llm_name, user, message):
+        """Send a message to every listener for a user. Safe to call from any thread."""
+        with self.lock:
+            listeners = list(self.subscribers.get(user, []))
+        for loop, queue in listeners:
+            loop.call_soon_threadsafe(queue.put_nowait, {'llm': llm_name, 'message': message})
+
+class ExtraMessages(dict):
+    """Per-user extra message lists that also notify a listener whenever a message is added."""
+    def __init__(self):
+        super().__init__()
+        self.listener = None
+
+    def __setitem__(self, user, messages):
+        super().__setitem__(user, ExtraMessageList(self, user, messages))
+
+    def __missing__(self, user):
+        self[user] = []
+        return super().__getitem__(user)
+
+class ExtraMessageList(list):
+    def __init__(self, owner, user, messages=()):
+        super().__init__(messages)
+        self.owner = owner
+        self.user = user
+
+    def append(self, message):
+        super().append(message)
+        if self.owner.listener:
+            self.owner.listener(self.user, message)
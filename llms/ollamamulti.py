@@ -2,20 +2,37 @@ import requests
 import ollama
 import json
 import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from llms.message_bus import ExtraMessages
 
 class OllamaMulti():
-    def __init__(self, api_base_url='http://localhost:11434', model='llama3.1', info_link='https://ollama.com/library', wait_limit=300):
+    def __init__(self, api_base_url='http://localhost:11434', model='llama3.1', info_link='https://ollama.com/library', wait_limit=300,
+                 max_steps=5, token_budget=32000, keep_alive='30m', tool_concurrency=None, default_tool_concurrency=8):
         self.api_base_url = api_base_url
         self.model = model
         self.conversation_history = {}
-        self.extra_messages = {}
+        self.extra_messages = ExtraMessages()
         self.info_link = info_link
-        self.wait_limit = wait_limit
+        self.wait_limit = int(wait_limit)
+        self.max_steps = int(max_steps) # Maximum rounds of tool calls per prompt
+        self.token_budget = int(token_budget) # Stop offering tools once a prompt has used this many tokens
+        self.keep_alive = keep_alive # Keep the model loaded between rounds so the cached prompt prefix is reused
         self.agent_instructions = None
         self.tools = []
         self.verify_answers_asked = False
+        self.tool_workers = 4 # Maximum tool calls run concurrently in one model turn
+        self.tool_groups = {} # Tool name -> group; limits apply per group (defaults to the tool name)
+        # Group -> maximum concurrent calls across all users, e.g. to stay within an external service's rate limit
+        self.tool_concurrency = self.parse_tool_limits(tool_concurrency)
+        self.default_tool_concurrency = int(default_tool_concurrency)
+        self.user_tool_concurrency = {} # Group -> maximum concurrent calls per user; unlimited unless listed
+        self.tool_semaphores = {}
+        self.user_tool_semaphores = {} # (user, group) -> [semaphore, holders]; removed when no call holds it
+        self.tool_semaphores_lock = threading.Lock()
 
-    def generate(self, user, prompt, tool_use=True):
+    def start_turn(self, user, prompt):
         if user not in self.conversation_history:
             self.conversation_history[user] = []
             self.conversation_history[user].append({
@@ -29,60 +46,117 @@ class OllamaMulti():
             'content': prompt_with_instructions
         })
 
-        # First response from the model
-        try:
-            if tool_use:
-                self.response = ollama.chat(
-                    model=self.model,
-                    messages=self.conversation_history[user],
-                    tools=self.tools,
-                    stream=False
-                )
-            else:
-                self.response = ollama.chat(
-                    model=self.model,
-                    messages=self.conversation_history[user],
-                    stream=False
-                )
-        except Exception as e:
-            print(f"Top level LLM request error: {e}")
-            return f"Top level LLM request error: {e}"
-
-        if self.response['message'].get('tool_calls'):
-            for tool_call in self.response['message']['tool_calls']:
-                tool_name = tool_call['function']['name']
-
-                if isinstance(tool_call['function']['arguments'], dict):
-                    tool_args = tool_call['function']['arguments']
-                else:
-                    tool_args = json.loads(tool_call['function']['arguments'])
-
-                tool_response = self.handle_tool(user, tool_name, tool_args, prompt)
+    def generate(self, user, prompt, tool_use=True):
+        self.start_turn(user, prompt)
+
+        # Keep calling the model until it stops asking for tools or a budget runs out
+        start_time = time.time()
+        tokens_used = 0
+        steps = 0
+        while True:
+            use_tools = (tool_use and steps < self.max_steps and tokens_used < self.token_budget
+                         and (time.time() - start_time) < self.wait_limit)
+            try:
+                response = self.chat(user, use_tools)
+            except Exception as e:
+                if steps == 0:
+                    print(f"Top level LLM request error: {e}")
+                    return f"Top level LLM request error: {e}"
+                print(f"Tool response error: {e}")
+                return f"Tool response error: {e}"
+
+            tokens_used += (response.get('prompt_eval_count') or 0) + (response.get('eval_count') or 0)
+            tool_calls = response['message'].get('tool_calls')
+            if not use_tools or not tool_calls:
+                break
+            steps += 1
+
+            # Record the tool request so the next round sees what was asked for
+            self.conversation_history[user].append({
+                'role': 'assistant',
+                'content': response['message'].get('content') or '',
+                'tool_calls': tool_calls
+            })
+
+            tool_responses = self.run_tool_calls(user, tool_calls, prompt)
 
+            # Results are added in the order the model asked for them
+            for tool_response in tool_responses:
                 self.conversation_history[user].append({
                     'role': 'tool',
                     'content': tool_response
                 })
 
-            # Process the response again after the tool calls
+        assistant_message = response['message']['content']
+        self.conversation_history[user].append({
+            'role': 'assistant',
+            'content': assistant_message
+        })
+        return assistant_message
+    
+    def generate_stream(self, user, prompt, tool_use=True):
+        self.start_turn(user, prompt)
+
+        # Same tool loop as generate, but each round is streamed so text reaches the caller as it is produced
+        start_time = time.time()
+        tokens_used = 0
+        steps = 0
+        while True:
+            use_tools = (tool_use and steps < self.max_steps and tokens_used < self.token_budget
+                         and (time.time() - start_time) < self.wait_limit)
+            content = ''
+            tool_calls = []
             try:
-                self.response = ollama.chat(
-                    model=self.model,
-                    messages=self.conversation_history[user],
-                    tools=self.tools,
-                    stream=False
-                )
+                for chunk in self.chat(user, use_tools, stream=True):
+                    message = chunk['message']
+                    if message.get('content'):
+                        content += message['content']
+                        yield message['content']
+                    if message.get('tool_calls'):
+                        tool_calls.extend(message['tool_calls'])
+                    if chunk.get('done'):
+                        tokens_used += (chunk.get('prompt_eval_count') or 0) + (chunk.get('eval_count') or 0)
             except Exception as e:
-                print(f"Tool response error: {e}")
-                return f"Tool response error: {e}"
+                print(f"LLM stream error: {e}")
+                yield f"LLM stream error: {e}"
+                return
+
+            if not use_tools or not tool_calls:
+                break
+            steps += 1
+
+            # Record the tool request so the next round sees what was asked for
+            self.conversation_history[user].append({
+                'role': 'assistant',
+                'content': content,
+                'tool_calls': tool_calls
+            })
+
+            tool_responses = self.run_tool_calls(user, tool_calls, prompt)
+
+            # Results are added in the order the model asked for them
+            for tool_response in tool_responses:
+                self.conversation_history[user].append({
+                    'role': 'tool',
+                    'content': tool_response
+                })
 
-        self.assistant_message = self.response['message']['content']
         self.conversation_history[user].append({
             'role': 'assistant',
-            'content': self.assistant_message
+            'content': content
         })
-        return self.assistant_message
-    
+
+    def chat(self, user, tool_use=True, stream=False):
+        chat_args = {
+            'model': self.model,
+            'messages': self.conversation_history[user],
+            'stream': stream,
+            'keep_alive': self.keep_alive
+        }
+        if tool_use:
+            chat_args['tools'] = self.tools
+        return ollama.chat(**chat_args)
+
     def get_extra_messages(self, user):
         if user not in self.extra_messages:
             self.extra_messages[user] = []  # Initialize the list if the key doesn't exist
@@ -93,6 +167,69 @@ class OllamaMulti():
     def handle_tool(self, user, tool_name, tool_args, prompt):
         return
 
+    def run_tool_calls(self, user, tool_calls, prompt):
+        calls = []
+        for tool_call in tool_calls:
+            tool_name = tool_call['function']['name']
+
+            if isinstance(tool_call['function']['arguments'], dict):
+                tool_args = tool_call['function']['arguments']
+            else:
+                tool_args = json.loads(tool_call['function']['arguments'])
+            calls.append((tool_name, tool_args))
+
+        if len(calls) == 1:
+            return [self.run_limited_tool(user, calls[0][0], calls[0][1], prompt)]
+
+        with ThreadPoolExecutor(max_workers=min(self.tool_workers, len(calls))) as executor:
+            futures = [executor.submit(self.run_limited_tool, user, tool_name, tool_args, prompt) for tool_name, tool_args in calls]
+            return [future.result() for future in futures]
+
+    def parse_tool_limits(self, limits):
+        # Limits come from the constructor as a dict, or from the config as "group=limit,group=limit"
+        if not limits:
+            return {}
+        if isinstance(limits, dict):
+            return {group: int(limit) for group, limit in limits.items()}
+        parsed = {}
+        for item in limits.split(','):
+            if '=' in item:
+                group, limit = item.split('=', 1)
+                parsed[group.strip()] = int(limit)
+        return parsed
+
+    def run_limited_tool(self, user, tool_name, tool_args, prompt):
+        group = self.tool_groups.get(tool_name, tool_name)
+        # Wait for the user's own slot first so a waiting call doesn't hold a shared one
+        with self.user_tool_slot(user, group), self.tool_semaphore(group):
+            return self.handle_tool(user, tool_name, tool_args, prompt)
+
+    def tool_semaphore(self, group):
+        with self.tool_semaphores_lock:
+            if group not in self.tool_semaphores:
+                self.tool_semaphores[group] = threading.BoundedSemaphore(self.tool_concurrency.get(group, self.default_tool_concurrency))
+            return self.tool_semaphores[group]
+
+    @contextmanager
+    def user_tool_slot(self, user, group):
+        # Per-user limits serialise calls that share the user's client or agent history
+        limit = self.user_tool_concurrency.get(group)
+        if not limit:
+            yield
+            return
+        key = (user, group)
+        with self.tool_semaphores_lock:
+            entry = self.user_tool_semaphores.setdefault(key, [threading.BoundedSemaphore(limit), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.tool_semaphores_lock:
+                entry[1] -= 1
+                if entry[1] == 0 and self.user_tool_semaphores.get(key) is entry:
+                    del self.user_tool_semaphores[key]
+
     def summarize_conversation(self, user, tool_use=False):
         if user not in self.conversation_history:
             return "No conversation history found."
@@ -9,9 +9,12 @@ from llms.tools.weather import WeatherChecker
 
 class OllamaOrchestrator(OllamaMulti):
     def __init__(self, api_base_url='http://localhost:11434', model='llama3.1', info_link='', wait_limit=300,
-                 google_key="", google_cx="",confluence_url="",confluence_token="",jira_url="",jira_token="",openweathermap_key=""):
+                 google_key="", google_cx="",confluence_url="",confluence_token="",jira_url="",jira_token="",openweathermap_key="",
+                 max_steps=5, token_budget=32000, keep_alive='30m', tool_concurrency=None, default_tool_concurrency=8):
         # Call the parent class constructor
-        super().__init__(api_base_url, model, info_link, wait_limit)
+        super().__init__(api_base_url, model, info_link, wait_limit,
+                         max_steps=max_steps, token_budget=token_budget, keep_alive=keep_alive,
+                         tool_concurrency=tool_concurrency, default_tool_concurrency=default_tool_concurrency)
 
         # Tools
         self.websearch = GoogleSearch(google_key, google_cx)
@@ -23,6 +26,15 @@ class OllamaOrchestrator(OllamaMulti):
         # Agents
         self.llama3_1_agent = OllamaMulti(api_base_url, 'llama3.1:latest')
 
+        # The agent tools share the local model and the user's history, and the Outlook tools
+        # share the user's client, so each group runs one call at a time per user
+        self.tool_groups = {
+            "agent_writer": "llama3_1_agent", "agent_researcher": "llama3_1_agent", "agent_mathmatician": "llama3_1_agent",
+            "outlook_search": "outlook", "outlook_mail_details": "outlook", "search_calendar_events": "outlook",
+            "check_room_availability": "outlook", "check_person_availability": "outlook"
+        }
+        self.user_tool_concurrency = {"llama3_1_agent": 1, "outlook": 1}
+
         self.verify_answers_asked = False
         # self.agent_instructions = """
         # You are an orchestrator agent. You should maximize the use of the tools available to you.
@@ -114,7 +126,7 @@ class OllamaOrchestrator(OllamaMulti):
                     "properties": {
                         "room_email": {
                         "type": "string",
-                        "description": "Email address of the room to check availability for."
+                        "description": "Email address of the room to check availability for. Separate several addresses with commas to check them all at once."
                         },
                         "start_date": {
                         "type": "string",
@@ -138,7 +150,7 @@ class OllamaOrchestrator(OllamaMulti):
                     "properties": {
                         "person_email": {
                         "type": "string",
-                        "description": "Email address of the person to check availability for."
+                        "description": "Email address of the person to check availability for. Separate several addresses with commas to check them all at once."
                         },
                         "start_date": {
                         "type": "string",
@@ -186,7 +198,7 @@ class OllamaOrchestrator(OllamaMulti):
                     "properties": {
                         "email_id": {
                         "type": "string",
-                        "description": "The ID of the e-mail to get details for."
+                        "description": "The ID of the e-mail to get details for. Separate several IDs with commas to get them all at once."
                         }
                     },
                     "required": ["email_id"]
@@ -343,15 +355,9 @@ class OllamaOrchestrator(OllamaMulti):
         elif tool_name == "jira_search":
             self.extra_messages[user].append(f'<HR><i>Searching JIRA for: {tool_args["JQL"]}</i>')
             jira_info = ""
-            jira_data = self.jira_search.search(tool_args['JQL'], num_results=10)
-            if jira_data is None:
-                results = "No search results found"
-            else:
-                # Get each link and page text from the search results
-                for ticket_text in jira_data:
-                    #append the link and page test
-                    jira_info += f"JIRA Text: {ticket_text}\n"
-                results = f'Your search to answer the question: {prompt} produced the following results:\n{jira_info}'
+            # Issue pages are fetched only until the prompt budget is filled
+            jira_info = self.jira_search.search_text(tool_args['JQL'], num_results=10, label='JIRA Text')
+            results = f'Your search to answer the question: {prompt} produced the following results:\n{jira_info}'
         elif tool_name == "outlook_search":
             msg_details = ""
             # Check if the user has a Outlook client
@@ -390,7 +396,9 @@ class OllamaOrchestrator(OllamaMulti):
                 except Exception as e:
                     return f"An error occurred: {e}"
             self.extra_messages[user].append(f'<HR><i>Getting Outlook Mail Details for: {tool_args["email_id"]}</i>')
-            email_details = self.outlook365_clients[user].get_email_details(tool_args['email_id'])
+            # Several IDs are fetched in one batched request
+            email_ids = [email_id.strip() for email_id in tool_args['email_id'].split(',') if email_id.strip()]
+            email_details = '\n'.join(str(details) for details in self.outlook365_clients[user].get_emails_details(email_ids))
             return email_details
         if tool_name == "search_calendar_events":
             events = None
@@ -1,11 +1,16 @@
 import openai
+import httpx
 import time
 import json
+import threading
 from llms.tools.image_gen import OpenAI_ImageGen
+from llms.message_bus import ExtraMessages
+from llms.assistant_registry import assistant_registry
+from llms.assistant_tools import AssistantToolRunner
 
-class OpenaiMulti():
+class OpenaiMulti(AssistantToolRunner):
     def __init__(self, api_key,model='gpt-4o',
-                 info_link='',wait_limit=300, type='chat'):
+                 info_link='',wait_limit=300, type='chat', run_mode='stream'):
         try:
             self.client = openai.Client()
             self.client.api_key = api_key
@@ -24,8 +29,17 @@ class OpenaiMulti():
         self.wait_limit = int(wait_limit)
         self.type = type
         self.token_run_size = 0 # Keep 0 to disable token run size
+        self.run_mode = run_mode # 'stream' follows run events, 'poll' polls the run status
+        self.poll_interval_min = 0.05
+        self.poll_interval_max = 1.0
+        self.stream_read_timeout = 60 # Seconds without a streamed event before a run is treated as stalled
+        self.tool_workers = 4 # Maximum tool calls run concurrently in one run step
+        self.tool_timeout = self.wait_limit
+        self.tool_groups = {} # Tool name -> group; tools in the same group never run concurrently
+        self.tool_overruns = {} # (user, group) -> tool run still going after its step timed out
+        self.tool_overruns_lock = threading.Lock()
         self.conversation_history = {}
-        self.extra_messages = {}
+        self.extra_messages = ExtraMessages()
         self.tools = [
             {
             "type": "function",
@@ -56,6 +70,20 @@ class OpenaiMulti():
         else:
             return "Not supported"
     
+    def generate_stream(self, user, prompt):
+        if self.type == 'assistant' and self.run_mode == 'stream':
+            self.prepare_assistant_run(user, prompt)
+            status = yield from self.stream_run_deltas(user)
+            if status == "completed":
+                self.number_of_responses += 1
+            else:
+                yield self.assistant_response(user, status)
+        elif self.type == 'chat' and self.model != 'o1-preview':
+            yield from self.direct_generate_stream(user, prompt)
+        else:
+            # Modes without token streaming return the whole response as one chunk
+            yield self.generate(user, prompt)
+
     def handle_tool(self, user, tool):
         tool_name = tool.function.name
         args = json.loads(tool.function.arguments)
@@ -110,17 +138,61 @@ class OpenaiMulti():
                 print(f'Could not process direct prompt to OpenAI: {e}')
                 return f'Could not process direct prompt to OpenAI: {e}'
 
+    def direct_generate_stream(self, user, prompt):
+        # Check if the user has a conversation history and create one if not
+        if user not in self.conversation_history:
+            self.conversation_history[user] = []
+
+        # Append the new user prompt to the conversation history
+        self.conversation_history[user].append({
+            'role': 'user',
+            'content': prompt
+        })
+        try:
+            completion = self.client.chat.completions.create(
+                model=self.model,
+                messages=self.conversation_history[user],
+                max_tokens=4000,
+                temperature=0.7,
+                top_p=0.95,
+                frequency_penalty=0,
+                presence_penalty=0,
+                stop=None,
+                stream=True
+            )
+            for chunk in completion:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            print(f'Could not process direct prompt to OpenAI: {e}')
+            yield f'Could not process direct prompt to OpenAI: {e}'
+
     def assistant_generate(self, user, prompt):
+        self.prepare_assistant_run(user, prompt)
+
+        if self.run_mode == 'stream':
+            status = self.stream_run(user)
+        else:
+            status = self.poll_run(user)
+
+        return self.assistant_response(user, status)
+
+    def create_assistant(self):
+        assistant = self.client.beta.assistants.create(name=self.assistant_name,model=self.model,tools=self.tools,instructions=self.agent_instructions)
+        try:
+            # Append the new assistant id
+            with open('openai_assistants.txt', 'a') as f:
+                f.write(f"{assistant.id}\n")
+        except Exception as e:
+            print(f'Could not write OpenAI Assistant ID to file: {e}')
+        return assistant
+
+    def prepare_assistant_run(self, user, prompt):
         # Check if the user has an Azure OpenAI ASSISTANT and create one if not
+        # Users share one assistant per definition; only threads are per user
         if user not in self.openai_assistant_id:
             try:
-                self.openai_assistant_id[user] = self.client.beta.assistants.create(name=self.assistant_name,model=self.model,tools=self.tools,instructions=self.agent_instructions)
-                try:
-                    # Append the new assistant id
-                    with open('openai_assistants.txt', 'a') as f:
-                        f.write(f"{self.openai_assistant_id[user].id}\n")
-                except Exception as e:
-                    print(f'Could not write OpenAI Assistant ID to file: {e}')
+                self.openai_assistant_id[user] = assistant_registry.get_assistant(assistant_registry.key(self, self.client), self.create_assistant)
             except Exception as e:
                 print(f'Could not create Assistant: {e}')
 
@@ -134,67 +206,128 @@ class OpenaiMulti():
                 content=prompt
             )
 
-        if self.token_run_size > 0:
-            run = self.client.beta.threads.runs.create(
-                thread_id=self.openai_assistant_thread[user].id,
-                assistant_id=self.openai_assistant_id[user].id,
-                max_completion_tokens=self.token_run_size
-            )
+    def assistant_response(self, user, status):
+        if status == "timed_out":
+            response = f"No response from Assistant after {self.wait_limit} seconds."
+        elif status != "completed":
+            response = f"The Assistant run ended with status: {status or 'error'}."
         else:
-            run = self.client.beta.threads.runs.create(
-                thread_id=self.openai_assistant_thread[user].id,
-                assistant_id=self.openai_assistant_id[user].id,
+            response = self.client.beta.threads.messages.list(
+                thread_id=self.openai_assistant_thread[user].id
             )
+            response = response.data[0].content[0].text.value
+            self.number_of_responses += 1
 
+        return response
+    
+    def run_arguments(self, user):
+        run_args = {
+            "thread_id": self.openai_assistant_thread[user].id,
+            "assistant_id": self.openai_assistant_id[user].id
+        }
+        if self.token_run_size > 0:
+            run_args["max_completion_tokens"] = self.token_run_size
+        return run_args
 
+    def stream_run(self, user):
+        deltas = self.stream_run_deltas(user)
+        while True:
+            try:
+                next(deltas)
+            except StopIteration as done:
+                return done.value
+
+    def stream_run_deltas(self, user):
+        # Follow the run through its streamed events instead of polling for status, yielding response text as it arrives
+        thread_id = self.openai_assistant_thread[user].id
         start_time = time.time()
-        result = ""
+        status = ""
+        run_id = None
+        timed_out = False
+        try:
+            stream = self.client.beta.threads.runs.stream(**self.run_arguments(user), timeout=self.stream_timeout(start_time))
+            while stream is not None:
+                next_stream = None
+                with stream as events:
+                    for event in events:
+                        if event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step."):
+                            run_id = event.data.id
+                        if event.event == "thread.run.requires_action":
+                            # The run pauses here; tool outputs resume it on a new stream
+                            tool_calls = event.data.required_action.submit_tool_outputs.tool_calls
+                            tool_outputs = self.run_tool_calls(user, tool_calls)
+                            next_stream = self.client.beta.threads.runs.submit_tool_outputs_stream(
+                                thread_id=thread_id,
+                                run_id=event.data.id,
+                                tool_outputs=tool_outputs,
+                                timeout=self.stream_timeout(start_time)
+                            )
+                        elif event.event == "thread.message.delta":
+                            for content in event.data.delta.content or []:
+                                if content.type == "text" and content.text and content.text.value:
+                                    yield content.text.value
+                        elif event.event in ("thread.run.completed", "thread.run.failed",
+                                             "thread.run.cancelled", "thread.run.expired", "thread.run.incomplete"):
+                            status = event.data.status
+                        if (time.time() - start_time) > self.wait_limit:
+                            timed_out = True
+                            break
+                if timed_out:
+                    break
+                stream = next_stream
+        except (httpx.TimeoutException, openai.APITimeoutError) as e:
+            # The stream went quiet for longer than its read timeout
+            print(f'Assistant run stream stalled: {e}')
+            timed_out = True
+        except Exception as e:
+            print(f'Error streaming Assistant run: {e}')
+        if not status and run_id:
+            self.cancel_run(thread_id, run_id)
+        return "timed_out" if timed_out and not status else status
+
+    def stream_timeout(self, start_time):
+        # A stream that goes quiet for this long raises a read timeout; never wait past the run's limit
+        remaining = self.wait_limit - (time.time() - start_time)
+        return max(1.0, min(self.stream_read_timeout, remaining))
+
+    def cancel_run(self, thread_id, run_id):
+        # Don't leave an abandoned run active on the thread; the next message would be rejected
+        try:
+            self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            print(f'Could not cancel Assistant run: {e}')
+
+    def poll_run(self, user):
+        # Poll the run status, starting fast and backing off to the maximum interval
+        run = self.client.beta.threads.runs.create(**self.run_arguments(user))
+        thread_id = self.openai_assistant_thread[user].id
+        start_time = time.time()
+        interval = self.poll_interval_min
+        result = None
         while (time.time() - start_time) < self.wait_limit:
-            result = self.client.beta.threads.runs.retrieve(thread_id=self.openai_assistant_thread[user].id,run_id=run.id)
-            # Check if the function returned a result and if the run is no longer queued
-            if result.status == "completed":
+            result = self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+            if result.status in ("completed", "failed", "cancelled", "expired", "incomplete"):
                 break
             elif result.status == "requires_action":
-                tool_outputs = []
-                for each_tool_call in result.required_action.submit_tool_outputs.tool_calls:
-                    try:
-                        response = self.handle_tool(user,each_tool_call)
-                        tool_outputs.append(
-                            {
-                                "tool_call_id": each_tool_call.id,
-                                "output":  response
-                            }
-                        )
-                    except:
-                        tool_outputs.append(
-                            {
-                                "tool_call_id": each_tool_call.id,
-                                "output":  "Error processing tool"
-                            }
-                        )
-                #Tool output has been submitted, so we can continue
+                tool_outputs = self.run_tool_calls(user, result.required_action.submit_tool_outputs.tool_calls)
+                # Tool output has been submitted, so we can continue
                 try:
-                    tool_run = self.client.beta.threads.runs.submit_tool_outputs(
-                            thread_id=self.openai_assistant_thread[user].id,
-                            run_id=run.id,
-                            tool_outputs=tool_outputs
-                            )
+                    self.client.beta.threads.runs.submit_tool_outputs(
+                        thread_id=thread_id,
+                        run_id=run.id,
+                        tool_outputs=tool_outputs
+                    )
                 except Exception as e:
                     print(f'Error submitting tool output: {e}')
+                interval = self.poll_interval_min
             else:
-                time.sleep(1)
-
-        if result.status != "completed":
-            response = f"No response from Assistant after {self.wait_limit} seconds."
-        else:
-            response = self.client.beta.threads.messages.list(
-                thread_id=self.openai_assistant_thread[user].id
-            )
-            response = response.data[0].content[0].text.value
-            self.number_of_responses += 1
+                time.sleep(interval)
+                interval = min(interval * 2, self.poll_interval_max)
+        if result is None or result.status not in ("completed", "failed", "cancelled", "expired", "incomplete"):
+            self.cancel_run(thread_id, run.id)
+            return "timed_out"
+        return result.status
 
-        return response
-    
     def get_extra_messages(self, user):
         if user not in self.extra_messages:
             self.extra_messages[user] = []  # Initialize the list if the key doesn't exist
@@ -28,6 +28,9 @@ class OpenaiOrchestrator(OpenaiMulti):
         self.math_agent = OllamaMulti('llama3.1:latest')
         self.weather_checker = WeatherChecker(openweathermap_key)
 
+        # These tools all use the claude_agent, so they must not run concurrently
+        self.tool_groups = {"agent_writer": "claude_agent", "agent_researcher": "claude_agent"}
+
         # Set the token run size for each agent
         self.websearch_agent.token_run_size = 3000
         self.mail_agent.token_run_size = 3000
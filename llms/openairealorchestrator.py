@@ -16,11 +16,15 @@ logger = logging.getLogger(__name__)
 class OpenaiRealOrchestrator(OpenaiRealtime):
     def __init__(self, api_key, model='gpt-4o-realtime-preview-2024-12-17',
                  info_link='', wait_limit=300, type='chat', voice="alloy",
+                 max_sessions=20, session_idle_timeout=300,
+                 resync_mode='batched', resync_turns=6,
                  google_key="", google_cx="", claude_key="", openweathermap_key=""):
         # Call the parent class constructor
         super().__init__(api_key, model=model,
                         info_link=info_link, wait_limit=wait_limit,
-                        type=type, voice=voice)
+                        type=type, voice=voice,
+                        max_sessions=max_sessions, session_idle_timeout=session_idle_timeout,
+                        resync_mode=resync_mode, resync_turns=resync_turns)
 
         # Initialize agents
         self.claude_agent = ClaudeMulti(claude_key)
@@ -218,14 +222,14 @@ class OpenaiRealOrchestrator(OpenaiRealtime):
         if tool_name == "generate_image":
             self.extra_messages[user].append(f'<HR><i>Generating image using this prompt: {args["prompt"]}</i>')
             print(f'Generating image using this prompt: {args["prompt"]}')
-            results = self.image_gen_tool.image_generate(prompt=args['prompt'])
+            results = await self.run_blocking(self.image_gen_tool.image_generate, prompt=args['prompt'])
         elif tool_name == "get_weather":
             if debug: logger.info("Getting the weather")
-            results = json.dumps(self.weather_checker.get_weather(args['latitude'], args['longitude']))
+            results = json.dumps(await self.run_blocking(self.weather_checker.get_weather, args['latitude'], args['longitude']))
             print(f'Getting the weather: {results}')
         elif tool_name == "get_forecast":
             if debug: logger.info("Getting the weather forecast")
-            results = json.dumps(self.weather_checker.get_forecast(args['latitude'], args['longitude']))
+            results = json.dumps(await self.run_blocking(self.weather_checker.get_forecast, args['latitude'], args['longitude']))
             print(f'Getting the weather forecast: {results}')
         elif tool_name == "date_time":
             if debug: logger.info("Getting the date and time")
@@ -234,7 +238,7 @@ class OpenaiRealOrchestrator(OpenaiRealtime):
         elif tool_name == "agent_writer":
             if debug: logger.info("Asking the Agent Writer (Claude)")
             self.claude_agent.agent_instructions = "You are a professional writer. Use the information and instructions provided to write a response."
-            results = self.claude_agent.generate(user, args['prompt'])
+            results = await self.run_blocking(self.claude_agent.generate, user, args['prompt'])
             print(f'Asking the Agent Writer (o1-preview): {results}')
         elif tool_name == "agent_researcher":
             if debug: logger.info("Asking the Agent Researcher (Claude)")
@@ -242,19 +246,19 @@ class OpenaiRealOrchestrator(OpenaiRealtime):
             print(f'Asking the Agent Researcher (o1-preview): {results}')
         elif tool_name == "agent_mathmatician":
             self.math_agent.agent_instructions = "You are a professional mathmatician. Use the information and instructions provided to solve the problem."
-            results = self.math_agent.generate(user, args['prompt'])
+            results = await self.run_blocking(self.math_agent.generate, user, args['prompt'])
             print(f'Asking the Agent Mathmatician: {results}')
         elif tool_name == "agent_websearch":
             if debug: logger.info("Asking the Agent Websearcher (o1-preview)")
-            results = self.websearch_agent.generate(user, args['prompt'])
+            results = await self.run_blocking(self.websearch_agent.generate, user, args['prompt'])
             print(f'Asking the Agent Websearcher (OpenAI): {results}')
         elif tool_name == "agent_mailsearch":
             if debug: logger.info("Asking the Agent Mailsearcher (OpenAI)")
-            results = self.mail_agent.generate(user, args['prompt'])
+            results = await self.run_blocking(self.mail_agent.generate, user, args['prompt'])
             print(f'Asking the Agent Mailsearcher (OpenAI): {results}')
         elif tool_name == "agent_calendarsearch":
             if debug: logger.info("Asking the Agent Calendar searcher (OpenAI)")
-            results = self.tasks_agent.generate(user, args['prompt'])
+            results = await self.run_blocking(self.tasks_agent.generate, user, args['prompt'])
             print(f'Asking the Agent Calendar searcher (OpenAI): {results}')
         else:
             results = "Tool not supported"
@@ -264,10 +268,11 @@ class OpenaiRealOrchestrator(OpenaiRealtime):
     async def clear_conversation(self, user):
         """Clear conversations for all agents."""
         await super().clear_conversation(user)
-        self.websearch_agent.clear_conversation(user)
-        self.researcher_agent.clear_conversation(user)
-        self.claude_agent.clear_conversation(user)
-        self.math_agent.clear_conversation(user)
+        # Sub-agents clear their threads over blocking HTTP calls
+        await self.run_blocking(self.websearch_agent.clear_conversation, user)
+        await self.run_blocking(self.researcher_agent.clear_conversation, user)
+        await self.run_blocking(self.claude_agent.clear_conversation, user)
+        await self.run_blocking(self.math_agent.clear_conversation, user)
         return "Conversation cleared"
 
 # Test Cell
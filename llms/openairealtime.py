@@ -6,28 +6,78 @@ import ssl
 import base64
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from llms.tools.image_gen import OpenAI_ImageGen
+from llms.message_bus import ExtraMessages
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Put on a generate_stream queue when a dropped response is regenerated from scratch
+STREAM_RESET = object()
+
+class RealtimeSession:
+    """Connection state for a single user's realtime WebSocket session."""
+    def __init__(self, user):
+        self.user = user
+        self.ws = None
+        self.receive_task = None
+        self.lock = asyncio.Lock()
+        self.current_response = ""
+        self.response_done = None
+        self.response_requested = False # response.create has been sent for the current response_done
+        self.last_activity_time = None
+        self.reconnect_started = None
+        self.deltas = None
+
+    def emit(self, text):
+        """Add text to the current response and pass it on to any stream listener."""
+        self.current_response += text
+        if self.deltas:
+            self.deltas.put_nowait(text)
+
+    def is_busy(self):
+        """Check if a response is currently being generated on this session."""
+        return self.lock.locked()
+
+    def touch(self):
+        """Record activity on the session."""
+        self.last_activity_time = asyncio.get_event_loop().time()
+
 class OpenaiRealtime:
     def __init__(self, api_key, model='gpt-4o-realtime-preview-2024-12-17',
-                 info_link='', wait_limit=300, type='chat', voice="alloy"):
+                 info_link='', wait_limit=300, type='chat', voice="alloy",
+                 max_sessions=20, session_idle_timeout=300,
+                 resync_mode='batched', resync_turns=6):
         self.api_key = api_key
         self.model = model
         self.info_link = info_link
         self.wait_limit = int(wait_limit)
         self.type = type
         self.voice = voice
-        self.ws = None
         self.conversation_history = {}
-        self.extra_messages = {}
-        self.current_response = ""
-        self.current_user = None
-        self.last_activity_time = None
+        self.extra_messages = ExtraMessages()
         self.SESSION_TIMEOUT = 55  # Set timeout to 55 seconds to be safe
+
+        # Session pool: one WebSocket connection per user
+        self.sessions = {}
+        self.max_sessions = int(max_sessions)
+        self.session_idle_timeout = int(session_idle_timeout)
+        self.idle_sweep_task = None
+
+        # Conversation resync on reconnect: 'full' replays every item, 'batched' sends the
+        # history as one item and 'compact' sends a truncated transcript of older turns plus the
+        # last few turns verbatim. Only 'compact' loses text, in exchange for a bounded resync
+        self.resync_mode = resync_mode
+        self.resync_turns = int(resync_turns)
+        self.resync_summary_chars = 500 # Per message in the compact transcript
+        self.resync_compact_chars = 4000 # Whole compact transcript; the oldest messages are dropped first
+
+        # Blocking tool calls (HTTP tools, sub-agents) run here so they never stall the event loop
+        self.tool_workers = 8
+        self.tool_executor = ThreadPoolExecutor(max_workers=self.tool_workers, thread_name_prefix='realtime-tools')
         
         # WebSocket Configuration
         self.url = "wss://api.openai.com/v1/realtime"
@@ -67,24 +117,81 @@ class OpenaiRealtime:
             "temperature": 0.7
         }
 
-    async def check_session(self):
+    async def get_session(self, user):
+        """Get the session for a user, creating one if needed."""
+        self.start_idle_sweep()
+        session = self.sessions.get(user)
+        if session:
+            session.touch()
+            return session
+
+        session = RealtimeSession(user)
+        session.touch()
+        self.sessions[user] = session
+        await self.evict_sessions(keep=session)
+        return session
+
+    def start_idle_sweep(self):
+        # Started on first use, once an event loop is running
+        if self.idle_sweep_task is None or self.idle_sweep_task.done():
+            self.idle_sweep_task = asyncio.create_task(self.sweep_idle_sessions())
+
+    async def sweep_idle_sessions(self):
+        """Close idle sessions periodically, whether or not new users arrive."""
+        interval = max(5, min(60, self.session_idle_timeout / 2))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_sessions()
+            except Exception as e:
+                logger.error(f"Error evicting idle sessions: {e}")
+
+    async def evict_sessions(self, keep=None):
+        """Close idle sessions and enforce the session cap."""
+        now = asyncio.get_event_loop().time()
+        for user, session in list(self.sessions.items()):
+            if session is keep or session.is_busy():
+                continue
+            if session.last_activity_time and now - session.last_activity_time > self.session_idle_timeout:
+                logger.info(f"Evicting idle session for {user}")
+                await self.close_session(user)
+
+        # Evict the least recently used idle sessions when over the cap
+        while len(self.sessions) > self.max_sessions:
+            idle = [s for s in self.sessions.values() if s is not keep and not s.is_busy()]
+            if not idle:
+                logger.warning(f"All {len(self.sessions)} realtime sessions are busy, exceeding cap of {self.max_sessions}")
+                break
+            oldest = min(idle, key=lambda s: s.last_activity_time or 0)
+            logger.info(f"Evicting least recently used session for {oldest.user}")
+            await self.close_session(oldest.user)
+
+    async def close_session(self, user):
+        """Close and remove the session for a user."""
+        session = self.sessions.pop(user, None)
+        if session:
+            await self.disconnect(session)
+
+    async def check_session(self, session):
         """Check if the session needs to be refreshed."""
-        if not self.ws:
-            return await self.connect()
+        if not session.ws:
+            return await self.connect(session)
             
         try:
             # Test if connection is still alive
-            pong_waiter = await self.ws.ping()
+            pong_waiter = await session.ws.ping()
             await asyncio.wait_for(pong_waiter, timeout=5)
             return
         except Exception:
-            logger.info("Session disconnected, reconnecting...")
-            await self.cleanup()
-            return await self.connect()
+            logger.info(f"Session for {session.user} disconnected, reconnecting...")
+            await self.disconnect(session)
+            return await self.connect(session)
 
-    async def connect(self):
+    async def connect(self, session):
         """Connect to the WebSocket server."""
-        logger.info(f"Connecting to WebSocket: {self.url}")
+        logger.info(f"Connecting to WebSocket for {session.user}: {self.url}")
+        if self.conversation_history.get(session.user):
+            session.reconnect_started = asyncio.get_event_loop().time()
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "OpenAI-Beta": "realtime=v1"
@@ -92,7 +199,7 @@ class OpenaiRealtime:
         
         try:
             # Use wait_for instead of timeout for better compatibility
-            self.ws = await asyncio.wait_for(
+            session.ws = await asyncio.wait_for(
                 websockets.connect(
                     f"{self.url}?model={self.model}",
                     extra_headers=headers,
@@ -101,18 +208,18 @@ class OpenaiRealtime:
                 timeout=30
             )
             logger.info("Successfully connected to WebSocket")
+            session.receive_task = asyncio.create_task(self.receive_loop(session))
             
             # Configure session
-            await self.send_event({
+            await self.send_event(session, {
                 "type": "session.update",
                 "session": self.session_config
             })
             logger.info("Session configuration sent")
-            self.last_activity_time = asyncio.get_event_loop().time()
+            session.touch()
             
             # Restore conversation if there is one
-            if self.current_user:
-                await self.restore_conversation(self.current_user)
+            await self.restore_conversation(session)
                 
         except asyncio.TimeoutError:
             logger.error("Connection timed out after 30 seconds")
@@ -129,23 +236,71 @@ class OpenaiRealtime:
             logger.error(f"Connection failed: {str(e)}")
             raise
 
-    async def send_event(self, event):
+    async def disconnect(self, session):
+        """Close a session's WebSocket connection and stop its receive loop."""
+        ws, session.ws = session.ws, None
+        task, session.receive_task = session.receive_task, None
+        if ws:
+            try:
+                await ws.close()
+                logger.info(f"WebSocket connection closed for {session.user}")
+            except Exception as e:
+                logger.error(f"Error closing WebSocket connection: {e}")
+        if task and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def send_event(self, session, event):
         """Send an event to the WebSocket server."""
-        if not self.ws:
-            await self.connect()
+        if not session.ws:
+            await self.connect(session)
         try:
-            await self.ws.send(json.dumps(event))
+            await session.ws.send(json.dumps(event))
             logger.debug(f"Event sent - type: {event['type']}")
         except websockets.ConnectionClosed:
             logger.info("Connection closed, reconnecting...")
-            await self.connect()
-            await self.ws.send(json.dumps(event))
+            await self.disconnect(session)
+            await self.connect(session)
+            await session.ws.send(json.dumps(event))
             logger.debug(f"Event resent - type: {event['type']}")
         except Exception as e:
             logger.error(f"Error sending event: {e}")
             raise
 
-    async def handle_event(self, event):
+    async def receive_loop(self, session):
+        """Read events from a session's WebSocket and dispatch them."""
+        ws = session.ws
+        try:
+            async for message in ws:
+                event = json.loads(message)
+                session.touch()
+                try:
+                    await self.handle_event(session, event)
+                except Exception as e:
+                    if session.response_done and not session.response_done.done():
+                        session.response_done.set_exception(e)
+                    continue
+
+                # Wake up the waiting generate call once the response is complete
+                if event.get("type") == "response.done":
+                    if session.response_done and not session.response_done.done():
+                        session.response_done.set_result(session.current_response)
+        except websockets.ConnectionClosed:
+            logger.info(f"WebSocket connection closed for {session.user}")
+        finally:
+            # disconnect() detaches the socket before closing it, so it is still attached only when the
+            # server closed it. Then fail a generate call waiting on a response from this socket so it
+            # reconnects; after our own disconnect (a reconnect or eviction) the caller carries on with
+            # the new socket, and a close before response.create is handled by send_event
+            if session.ws is ws:
+                session.ws = None
+                if session.response_requested and session.response_done and not session.response_done.done():
+                    session.response_done.set_exception(websockets.ConnectionClosed(getattr(ws, 'close_rcvd', None), getattr(ws, 'close_sent', None)))
+
+    async def handle_event(self, session, event):
         """Handle incoming events from the WebSocket server."""
         event_type = event.get("type")
         
@@ -170,10 +325,12 @@ class OpenaiRealtime:
             logger.info(f"Audio transcription completed: {transcript}")
             
         elif event_type == "response.text.delta":
-            self.current_response += event["delta"]
+            self.log_reconnect_latency(session)
+            session.emit(event["delta"])
             
         elif event_type == "response.done":
             logger.info("Response generation completed")
+            self.log_reconnect_latency(session)
             if "usage" in event:
                 usage = event["usage"]
                 logger.info(f"Token usage - Total: {usage.get('total_tokens')}, "
@@ -187,8 +344,8 @@ class OpenaiRealtime:
                                  f"(resets in {limit['reset_seconds']} seconds)")
                     
         elif event_type == "response.function_call_arguments.done":
-            response = await self.handle_tool(self.current_user, event)
-            self.current_response += response
+            response = await self.handle_tool(session.user, event)
+            session.emit(response)
         else:
             logger.debug(f"Unhandled event type: {event_type}")
 
@@ -200,17 +357,19 @@ class OpenaiRealtime:
 
         if tool_name == "generate_image":
             self.extra_messages[user].append(f'<HR><i>Generating image using this prompt: {args["prompt"]}</i>')
-            results = self.image_gen_tool.image_generate(prompt=args['prompt'])
+            results = await self.run_blocking(self.image_gen_tool.image_generate, prompt=args['prompt'])
         else:
             results = "Tool not supported"
 
         return results
 
-    async def generate(self, user, prompt):
+    async def run_blocking(self, func, *args, **kwargs):
+        """Run a blocking call on the tool executor and wait for its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.tool_executor, partial(func, *args, **kwargs))
+
+    async def generate(self, user, prompt, retry=True, deltas=None):
         """Generate a response using the Realtime API."""
-        self.current_user = user
-        self.current_response = ""
-        
         if user not in self.conversation_history:
             self.conversation_history[user] = []
         if user not in self.extra_messages:
@@ -226,63 +385,112 @@ class OpenaiRealtime:
             }]
         }
         
-        # Add to history
-        self.conversation_history[user].append(message)
-        
-        try:
-            await self.check_session()
-            
-            # Create a conversation item with the user's prompt
-            await self.send_event({
-                "type": "conversation.item.create",
-                "item": message
-            })
-            logger.info("User message created")
-            
-            # Request a response
-            await self.send_event({"type": "response.create"})
-            logger.info("Response requested")
-            
-            # Wait for and process the response
+        session = await self.get_session(user)
+        retry_prompt = False
+
+        # Requests from the same user share a conversation, so they run one at a time
+        async with session.lock:
+            session.current_response = ""
+            session.deltas = deltas
+            session.response_done = asyncio.get_event_loop().create_future()
+            session.response_requested = False
             try:
-                async for message in self.ws:
-                    event = json.loads(message)
-                    await self.handle_event(event)
-                    
-                    # If we've received a response.done event, we can stop listening
-                    if event.get("type") == "response.done":
-                        # Store assistant's response in history
-                        if self.current_response:
-                            self.conversation_history[user].append({
-                                "type": "message",
-                                "role": "assistant",
-                                "content": [{
-                                    "type": "text",
-                                    "text": self.current_response
-                                }]
-                            })
-                        break
-                        
-            except websockets.ConnectionClosed:
-                logger.error("WebSocket connection closed")
-                # Try to reconnect and resend the prompt
-                await self.check_session()
-                return await self.generate(user, prompt)
-            
-            return self.current_response
-            
-        except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            return f"Error generating response: {e}"
+                await self.check_session(session)
+                
+                # Create a conversation item with the user's prompt
+                await self.send_event(session, {
+                    "type": "conversation.item.create",
+                    "item": message
+                })
+                logger.info("User message created")
+
+                # Add to history
+                self.conversation_history[user].append(message)
+                
+                # Request a response
+                await self.send_event(session, {"type": "response.create"})
+                session.response_requested = True
+                if not session.ws and not session.response_done.done():
+                    # The server closed the socket while the request was being sent
+                    session.response_done.set_exception(websockets.ConnectionClosed(None, None))
+                logger.info("Response requested")
+                
+                # Wait for the receive loop to signal the response is complete
+                try:
+                    await asyncio.wait_for(asyncio.shield(session.response_done), timeout=self.wait_limit)
+                except websockets.ConnectionClosed:
+                    logger.error("WebSocket connection closed")
+                    if not retry:
+                        raise
+                    # Drop the unanswered prompt so the reconnect doesn't replay it twice
+                    if self.conversation_history[user] and self.conversation_history[user][-1] is message:
+                        self.conversation_history[user].pop()
+                    # The retried response starts over, so the text streamed so far is discarded
+                    if deltas is not None and session.current_response:
+                        deltas.put_nowait(STREAM_RESET)
+                    retry_prompt = True
+                else:
+                    # Store assistant's response in history
+                    if session.current_response:
+                        self.conversation_history[user].append({
+                            "type": "message",
+                            "role": "assistant",
+                            "content": [{
+                                "type": "text",
+                                "text": session.current_response
+                            }]
+                        })
+                    return session.current_response
+
+            except asyncio.TimeoutError:
+                logger.error(f"No response after {self.wait_limit} seconds")
+                return f"No response from Assistant after {self.wait_limit} seconds."
+            except Exception as e:
+                logger.error(f"Error generating response: {e}")
+                return f"Error generating response: {e}"
+            finally:
+                session.response_done = None
+                session.response_requested = False
+                session.deltas = None
+                session.touch()
+
+        # Try to reconnect and resend the prompt
+        if retry_prompt:
+            return await self.generate(user, prompt, retry=False, deltas=deltas)
+
+    async def generate_stream(self, user, prompt):
+        """Generate a response, yielding text deltas as they arrive."""
+        deltas = asyncio.Queue()
+        task = asyncio.create_task(self.generate(user, prompt, deltas=deltas))
+        task.add_done_callback(lambda _: deltas.put_nowait(None))
+
+        streamed = ""
+        while True:
+            delta = await deltas.get()
+            if delta is None:
+                break
+            if delta is STREAM_RESET:
+                # Text already sent can't be taken back; mark where the regenerated response begins
+                streamed = ""
+                yield "\n\n(Connection lost, regenerating the response)\n\n"
+                continue
+            streamed += delta
+            yield delta
+
+        # Errors and timeouts are only reported through the final response
+        response = task.result()
+        if response and response.startswith(streamed):
+            if response[len(streamed):]:
+                yield response[len(streamed):]
+        elif response:
+            yield f"\n{response}"
 
     async def clear_conversation(self, user):
         """Clear the conversation history for a user."""
         if self.type == 'chat':
             self.conversation_history[user] = []
-            # Reconnect to start a fresh session
-            if self.ws:
-                await self.ws.close()
-                self.ws = None
+            # Close the user's session so the next request starts a fresh one
+            await self.close_session(user)
             return "Conversation cleared."
         else:
             return "Not supported"
@@ -308,26 +516,75 @@ class OpenaiRealtime:
         return messages
 
     async def cleanup(self):
-        """Clean up resources by closing the WebSocket connection."""
-        if self.ws:
+        """Clean up resources by closing every session's WebSocket connection."""
+        if self.idle_sweep_task:
+            self.idle_sweep_task.cancel()
+            self.idle_sweep_task = None
+        for user in list(self.sessions.keys()):
             try:
-                await self.ws.close()
-                logger.info("WebSocket connection closed")
+                await self.close_session(user)
             except Exception as e:
-                logger.error(f"Error closing WebSocket connection: {e}")
-            finally:
-                self.ws = None
-                self.current_response = ""
-                logger.info("Cleanup completed")
+                logger.error(f"Error closing session for {user}: {e}")
+        logger.info("Cleanup completed")
 
-    async def restore_conversation(self, user):
+    async def restore_conversation(self, session):
         """Restore conversation history for a user after reconnecting."""
-        if user not in self.conversation_history:
+        user = session.user
+        history = self.conversation_history.get(user)
+        if not history:
             return
-            
-        for message in self.conversation_history[user]:
-            await self.send_event({
+
+        if self.resync_mode == 'full':
+            items = history
+        elif self.resync_mode == 'batched':
+            items = [self.history_transcript_item(history)]
+        else:
+            # Condense everything but the most recent turns into a single item
+            older = history[:-self.resync_turns] if self.resync_turns > 0 else history
+            recent = history[-self.resync_turns:] if self.resync_turns > 0 else []
+            items = recent
+            if older:
+                items = [self.history_transcript_item(older, max_chars=self.resync_summary_chars, max_total_chars=self.resync_compact_chars)] + recent
+
+        for item in items:
+            await self.send_event(session, {
                 "type": "conversation.item.create",
-                "item": message
+                "item": item
             })
-            logger.debug(f"Restored message: {message['role']}")
\ No newline at end of file
+        logger.info(f"Restored {len(history)} messages for {user} in {len(items)} events ({self.resync_mode} resync)")
+
+    def history_transcript_item(self, messages, max_chars=None, max_total_chars=None):
+        """Build a single conversation item containing a transcript of the given messages.
+
+        max_chars truncates each message; max_total_chars keeps only the newest messages that fit.
+        """
+        lines = []
+        used = 0
+        for message in reversed(messages):
+            text = " ".join(part.get("text", "") for part in message.get("content", []))
+            if max_chars and len(text) > max_chars:
+                text = text[:max_chars] + '...'
+            line = f"{message['role'].capitalize()}: {text}"
+            if max_total_chars and used + len(line) > max_total_chars:
+                lines.append("(earlier messages omitted)")
+                break
+            lines.append(line)
+            used += len(line) + 1
+        lines.reverse()
+
+        return {
+            "type": "message",
+            "role": "system",
+            "content": [{
+                "type": "input_text",
+                "text": "Conversation so far:\n" + "\n".join(lines)
+            }]
+        }
+
+    def log_reconnect_latency(self, session):
+        """Log the time from a reconnect to the first response token."""
+        if session.reconnect_started is None:
+            return
+        latency = asyncio.get_event_loop().time() - session.reconnect_started
+        session.reconnect_started = None
+        logger.info(f"Reconnect to first token for {session.user}: {latency:.3f}s ({self.resync_mode} resync)")
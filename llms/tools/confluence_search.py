@@ -1,12 +1,21 @@
 import os
-import requests
+from llms.tools.http_client import http_client
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
+from llms.tools.html_text import html_to_text
+from llms.tools.ttl_cache import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+
+# Page text keyed by page id and version; a new version gets a new key so entries never go stale
+page_cache = TTLCache('confluence_pages', max_entries=512, ttl=86400)
 
 class ConfluenceSearch:
-    def __init__(self, url, api_token):
+    def __init__(self, url, api_token, max_page_chars=30000, extractor=html_to_text, fetch_workers=5, page_cache=page_cache):
         self.url = url
         self.api_token = api_token
+        self.max_page_chars = max_page_chars # Page text is cut here before it reaches a prompt
+        self.extractor = extractor # Turns a page's storage format HTML into text
+        self.fetch_workers = fetch_workers
+        self.page_cache = page_cache
         self.headers = {
             'Authorization': f'Bearer {self.api_token}',
             'Content-Type': 'application/json'
@@ -18,12 +27,14 @@ class ConfluenceSearch:
         search_url = f'{self.url}/rest/api/content/search'
         params = {
             'cql': cql,
-            'limit': num_results
+            'limit': num_results,
+            # Return page bodies with the search results instead of fetching each page afterwards
+            'expand': 'body.storage,version'
         }
-        page_ids, page_contents = [], []
+        page_contents = []
 
         try:
-            response = requests.get(search_url, headers=self.headers, params=params)
+            response = http_client.get(search_url, headers=self.headers, params=params)
             response.raise_for_status()
             confluence_search_results = response.json().get('results', [])
 
@@ -32,27 +43,66 @@ class ConfluenceSearch:
             #print(f"Response Status Code: {response.status_code}")
             #print(f"Response JSON: {response.json()}")
 
-            for each in confluence_search_results:
-                if each['type'] == 'page':
-                    page_id = each['id']
-                    page_ids.append(page_id)
-                    
-                    page_content_url = f'{self.url}/rest/api/content/{page_id}?expand=body.storage'
-                    page_response = requests.get(page_content_url, headers=self.headers)
-                    page_response.raise_for_status()
-                    page_content = page_response.json()
-                    
-                    if 'body' in page_content and 'storage' in page_content['body']:
-                        title = page_content['title']
-                        url = f"{self.url}/pages/viewpage.action?pageId={page_id}"
-                        body = BeautifulSoup(page_content['body']['storage']['value'], 'html.parser').get_text()
-                        content = f"----\nPage: {title}\n{title} URL: {url}\n{title} Content: {body}\n----\n"
-                        page_contents.append(content)
+            pages = [each for each in confluence_search_results if each['type'] == 'page']
+
+            # Fall back to fetching bodies the search didn't return, concurrently
+            missing = [page for page in pages if not self.has_body(page) and not self.is_cached(page)]
+            if missing:
+                with ThreadPoolExecutor(max_workers=min(self.fetch_workers, len(missing))) as executor:
+                    fetched = dict(zip([page['id'] for page in missing], executor.map(self.fetch_page, [page['id'] for page in missing])))
+                pages = [fetched.get(page['id'], page) for page in pages]
+
+            for page in pages:
+                content = self.page_content(page)
+                if content:
+                    page_contents.append(content)
             return page_contents
         except Exception as e:
             print(f"An error occurred: {str(e)}")
             return "Could not retrieve search results"
 
+    def site_search(self, cql, num_results=1):
+        # The agents build the siteSearch CQL themselves
+        return self.search(cql, num_results=num_results)
+
+    def fetch_page(self, page_id):
+        page_content_url = f'{self.url}/rest/api/content/{page_id}?expand=body.storage,version'
+        page_response = http_client.get(page_content_url, headers=self.headers)
+        page_response.raise_for_status()
+        return page_response.json()
+
+    def has_body(self, page):
+        return 'body' in page and 'storage' in page['body']
+
+    def is_cached(self, page):
+        cache_key = self.page_cache_key(page)
+        return cache_key is not None and self.page_cache.get(cache_key) is not None
+
+    def page_cache_key(self, page):
+        version = page.get('version', {}).get('number')
+        if version is None:
+            return None
+        return f"{self.url}|{page['id']}|{version}"
+
+    def page_content(self, page):
+        """Format a page for the prompt, reusing the cached text for an unchanged page version."""
+        cache_key = self.page_cache_key(page)
+        if cache_key:
+            content = self.page_cache.get(cache_key)
+            if content is not None:
+                return content
+
+        if not self.has_body(page):
+            return None
+        page_id = page['id']
+        title = page['title']
+        url = f"{self.url}/pages/viewpage.action?pageId={page_id}"
+        body = self.extractor(page['body']['storage']['value'], max_chars=self.max_page_chars, main_content=False)
+        content = f"----\nPage: {title}\n{title} URL: {url}\n{title} Content: {body}\n----\n"
+        if cache_key:
+            self.page_cache.set(cache_key, content)
+        return content
+
 # Test Cell
 # Please do not modify
 if __name__ == '__main__':
@@ -1,5 +1,5 @@
 import os
-import requests
+from llms.tools.http_client import http_client
 from dotenv import load_dotenv
 
 class GleanSearch:
@@ -29,7 +29,7 @@ class GleanSearch:
         }
 
         try:
-            response = requests.post(search_url, headers=self.headers, json=payload)
+            response = http_client.post(search_url, headers=self.headers, json=payload)
             response.raise_for_status()
             data = response.json()
             results_list = []
@@ -73,7 +73,7 @@ class GleanSearch:
             "messages": formatted_messages
         }
         try:
-            response = requests.post(chat_url, headers=self.headers, json=payload)
+            response = http_client.post(chat_url, headers=self.headers, json=payload)
             response.raise_for_status()
             data = response.json()
             primary_message = None
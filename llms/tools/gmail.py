@@ -1,9 +1,14 @@
 import os
+import time
 import base64
 import pickle
+import threading
+from datetime import datetime, timedelta, timezone
 from google.auth.transport.requests import Request  # pip install google-auth
 from google_auth_oauthlib.flow import InstalledAppFlow # pip install google-auth-oauthlib
 from googleapiclient.discovery import build # pip install google-api-python-client
+from googleapiclient.errors import HttpError
+from llms.tools.mail_store import MailStore
 
 # Create a Project in the Google Developers Console:
     # Go to the Google Developers Console: https://console.developers.google.com/
@@ -17,6 +22,9 @@ from googleapiclient.discovery import build # pip install google-api-python-clie
 # The class will save the credentials in a user_token.pickle file for future use
 
 class GmailClient:
+    full_sync_threads = {} # Background full syncs by store path
+    full_sync_lock = threading.Lock()
+
     def __init__(self, user):
         self.creds = None
         self.credentials_file = f'{user}_gmail_credentials.json'
@@ -28,6 +36,16 @@ class GmailClient:
         ]
         self.service = None
         self.calendar_service = None
+
+        # Local mail store kept current with Gmail history ids
+        self.use_local_store = True
+        self.store = MailStore(user)
+        self.sync_days = 365 # The first sync downloads mail this far back
+        self.sync_max_messages = 2000 # ...up to this many messages
+        self.sync_interval = 30 # Minimum seconds between history syncs
+        self.batch_size = 50 # Requests per batch HTTP call; Gmail rate limits larger batches
+        self.max_retries = 3
+        self.last_sync = 0
         self.login()
 
     def login(self):
@@ -50,71 +68,245 @@ class GmailClient:
         self.calendar_service = build('calendar', 'v3', credentials=self.creds)
 
     def search_emails(self, query='', max_results=100):
+        # Gmail operators (from:, is:, OR, ...) go to the API. The store only holds headers and snippets of recent
+        # mail, so a plain keyword search is answered locally only when it fills the page
+        if self.use_local_store and self.store.is_plain_query(query):
+            try:
+                self.sync_mail()
+                sync_start = self.store.get_state('gmail_sync_start')
+                now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+                messages = self.store.search_messages('gmail', query, sync_start, now, max_results) if sync_start else []
+                if len(messages) >= max_results:
+                    return [{'id': message['id']} for message in messages]
+            except Exception as e:
+                print(f'Local mail store unavailable, searching Gmail instead: {e}')
+
         try:
-            messages = []
-            response = self.service.users().messages().list(userId='me', q=query, maxResults=max_results).execute()
-            if 'messages' in response:
-                messages.extend(response['messages'])
-            
-            while 'nextPageToken' in response:
-                page_token = response['nextPageToken']
-                response = self.service.users().messages().list(userId='me', q=query, maxResults=max_results, pageToken=page_token).execute()
-                if 'messages' in response:
-                    messages.extend(response['messages'])
-            
-            return messages
+            return list(self.iter_messages(query, max_results))
+        except Exception as e:
+            print(f'An error occurred: {e}')
+            return None
+
+    def iter_messages(self, query='', max_results=100):
+        """Yield up to max_results message ids matching a query, one page at a time."""
+        count = 0
+        page_token = None
+        while count < max_results:
+            response = self.service.users().messages().list(
+                userId='me', q=query, maxResults=min(500, max_results - count), pageToken=page_token).execute()
+            for message in response.get('messages', [])[:max_results - count]:
+                count += 1
+                yield message
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+    def batch_get_messages(self, message_ids, format='metadata', service=None):
+        """Get many messages through batch HTTP requests. Messages that no longer exist are skipped."""
+        service = service or self.service
+        message_ids = list(dict.fromkeys(message_ids))
+        results = {}
+        pending = message_ids
+        for attempt in range(self.max_retries + 1):
+            failed = []
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    results[request_id] = response
+                elif isinstance(exception, HttpError) and exception.resp.status in (403, 429, 500, 503) and attempt < self.max_retries:
+                    # Rate limited or transient; retried in the next round
+                    failed.append(request_id)
+                elif not (isinstance(exception, HttpError) and exception.resp.status == 404):
+                    print(f'An error occurred getting message {request_id}: {exception}')
+
+            for offset in range(0, len(pending), self.batch_size):
+                batch = service.new_batch_http_request(callback=callback)
+                for message_id in pending[offset:offset + self.batch_size]:
+                    if format == 'metadata':
+                        request = service.users().messages().get(userId='me', id=message_id, format='metadata', metadataHeaders=['Subject', 'From', 'To', 'Date'])
+                    else:
+                        request = service.users().messages().get(userId='me', id=message_id, format=format)
+                    batch.add(request, request_id=message_id)
+                batch.execute()
+            if not failed:
+                break
+            pending = failed
+            time.sleep(2 ** attempt)
+        return [results[message_id] for message_id in message_ids if message_id in results]
+
+    def get_emails_details(self, message_ids, format='metadata'):
+        """Describe several emails using batched requests. The default metadata format uses the snippet instead of the body."""
+        try:
+            return [self.format_message(message) for message in self.batch_get_messages(message_ids, format)]
         except Exception as e:
             print(f'An error occurred: {e}')
+            return []
+
+    def sync_mail(self):
+        """Apply mailbox changes since the last history id to the local store.
+
+        The first sync downloads recent mail in a background thread; searches use the API until it completes.
+        """
+        history_id = self.store.get_state('gmail_history_id')
+        if not history_id:
+            self.start_full_sync()
+            return
+        if time.time() - self.last_sync < self.sync_interval:
+            return
+        try:
+            self.sync_history(history_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # The history id is too old; download again in the background
+            self.store.set_state('gmail_history_id', None)
+            self.store.set_state('gmail_sync_start', None)
+            self.start_full_sync()
+            return
+        self.last_sync = time.time()
+
+    def start_full_sync(self):
+        # One download per store, even when several agents hold a client for the same user
+        with GmailClient.full_sync_lock:
+            thread = GmailClient.full_sync_threads.get(self.store.path)
+            if thread and thread.is_alive():
+                return
+            # A failed download is retried after sync_interval
+            if time.time() - self.last_sync < self.sync_interval:
+                return
+            thread = threading.Thread(target=self.background_full_sync, daemon=True)
+            GmailClient.full_sync_threads[self.store.path] = thread
+            thread.start()
+
+    def background_full_sync(self):
+        try:
+            # API service objects aren't thread-safe, so the download uses its own
+            self.full_sync(build('gmail', 'v1', credentials=self.creds))
+        except Exception as e:
+            print(f'Gmail sync stopped, it is retried on a later search: {e}')
+        finally:
+            self.last_sync = time.time()
+
+    def full_sync(self, service=None):
+        service = service or self.service
+        # The store answers searches again only once the download completes
+        self.store.set_state('gmail_sync_start', None)
+        # Take the history id first so changes made during the download are picked up by the next sync
+        history_id = service.users().getProfile(userId='me').execute()['historyId']
+        message_ids = []
+        page_token = None
+        while len(message_ids) < self.sync_max_messages:
+            response = service.users().messages().list(
+                userId='me', q=f'newer_than:{self.sync_days}d', maxResults=500, pageToken=page_token).execute()
+            message_ids.extend(message['id'] for message in response.get('messages', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        message_ids = message_ids[:self.sync_max_messages]
+
+        self.store.clear('gmail', 'messages')
+        messages = self.get_messages_metadata(message_ids, service)
+        self.store.upsert_messages('gmail', messages)
+
+        # If the message cap was hit the store only reaches back to the oldest message kept
+        sync_start = (datetime.now(timezone.utc) - timedelta(days=self.sync_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if page_token and messages:
+            sync_start = min(message['received'] for message in messages)
+        self.store.set_state('gmail_sync_start', sync_start)
+        self.store.set_state('gmail_history_id', str(history_id))
+
+    def sync_history(self, history_id):
+        added, deleted = [], set()
+        page_token = None
+        while True:
+            response = self.service.users().history().list(
+                userId='me', startHistoryId=history_id, historyTypes=['messageAdded', 'messageDeleted'], pageToken=page_token).execute()
+            for record in response.get('history', []):
+                added.extend(item['message']['id'] for item in record.get('messagesAdded', []))
+                deleted.update(item['message']['id'] for item in record.get('messagesDeleted', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        added = list(dict.fromkeys(message_id for message_id in added if message_id not in deleted))
+        self.store.delete_messages('gmail', list(deleted))
+        self.store.upsert_messages('gmail', self.get_messages_metadata(added))
+        self.store.set_state('gmail_history_id', str(response.get('historyId', history_id)))
+
+    def get_messages_metadata(self, message_ids, service=None):
+        messages = []
+        for message in self.batch_get_messages(message_ids, 'metadata', service):
+            metadata = self.message_metadata(message)
+            if metadata:
+                messages.append(metadata)
+        return messages
+
+    def message_metadata(self, message):
+        # Spam and trash aren't searched, matching the API's default
+        if {'SPAM', 'TRASH'} & set(message.get('labelIds', [])):
             return None
+        headers = {header.get('name'): header.get('value') for header in message.get('payload', {}).get('headers', [])}
+        received = datetime.fromtimestamp(int(message.get('internalDate', 0)) / 1000, timezone.utc)
+        return {
+            'id': message['id'],
+            'subject': headers.get('Subject'),
+            'sender': headers.get('From'),
+            'received': received.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'preview': message.get('snippet')
+        }
 
     def get_email_details(self, message_id):
         try:
             message = self.service.users().messages().get(userId='me', id=message_id).execute()
-            payload = message.get('payload')
-            headers = payload.get('headers', [])
-            parts = payload.get('parts', [])
-            snippet = message.get('snippet')
-            body_data = None
-
-            if parts:
-                for part in parts:
-                    if part.get('body', {}).get('data'):
-                        body_data = part['body']['data']
-                        break
-            else:
-                body_data = payload.get('body', {}).get('data')
-
-            subject = 'No subject found.'
-            sender = 'No sender found.'
-            date = 'No date found.'
-            to = 'No recipient found.'
-
-            for header in headers:
-                name = header.get('name')
-                value = header.get('value')
-                if name == 'Subject':
-                    subject = value
-                elif name == 'From':
-                    sender = value
-                elif name == 'Date':
-                    date = value
-                elif name == 'To':
-                    to = value
-
-            if body_data:
-                msg_str = base64.urlsafe_b64decode(body_data).decode('utf-8')
-            elif snippet:
-                msg_str = snippet
-            else:
-                msg_str = "No message body found."
-
-            email_link = f"https://mail.google.com/mail/u/0/#inbox/{message_id}"
-
-            return f'subject: {subject}, sender: {sender}, to: {to}, date: {date}, message: {msg_str}, link: {email_link}'
+            return self.format_message(message)
         except Exception as e:
             print(f'An error occurred: {e}')
             return None
 
+    def format_message(self, message):
+        message_id = message['id']
+        payload = message.get('payload', {})
+        headers = payload.get('headers', [])
+        parts = payload.get('parts', [])
+        snippet = message.get('snippet')
+        body_data = None
+
+        if parts:
+            for part in parts:
+                if part.get('body', {}).get('data'):
+                    body_data = part['body']['data']
+                    break
+        else:
+            body_data = payload.get('body', {}).get('data')
+
+        subject = 'No subject found.'
+        sender = 'No sender found.'
+        date = 'No date found.'
+        to = 'No recipient found.'
+
+        for header in headers:
+            name = header.get('name')
+            value = header.get('value')
+            if name == 'Subject':
+                subject = value
+            elif name == 'From':
+                sender = value
+            elif name == 'Date':
+                date = value
+            elif name == 'To':
+                to = value
+
+        if body_data:
+            msg_str = base64.urlsafe_b64decode(body_data).decode('utf-8', errors='replace')
+        elif snippet:
+            msg_str = snippet
+        else:
+            msg_str = "No message body found."
+
+        email_link = f"https://mail.google.com/mail/u/0/#inbox/{message_id}"
+
+        return f'subject: {subject}, sender: {sender}, to: {to}, date: {date}, message: {msg_str}, link: {email_link}'
+
     def mark_as_read(self, message_id):
         try:
             self.service.users().messages().modify(
@@ -1,45 +1,121 @@
+import time
 import requests
-from bs4 import BeautifulSoup  # pip install beautifulsoup4
+from concurrent.futures import ThreadPoolExecutor, wait
+from llms.tools.http_client import http_client
+from llms.tools.html_text import html_to_text
+from llms.tools.ttl_cache import TTLCache
+
+# Shared by every GoogleSearch so repeated searches from any user or agent are served from memory
+search_cache = TTLCache('google_search', max_entries=512, ttl=900)
+page_cache = TTLCache('google_pages', max_entries=256, ttl=3600)
 
 class GoogleSearch:
-    def __init__(self, api_key, google_cx):
+    def __init__(self, api_key, google_cx, deadline=20, max_page_bytes=2000000, fetch_workers=5, max_page_chars=30000, extractor=html_to_text, search_cache=search_cache, page_cache=page_cache):
         self.api_key = api_key
         self.google_cx = google_cx
+        self.deadline = deadline # Seconds allowed for fetching all result pages
+        self.max_page_bytes = max_page_bytes # Larger pages are truncated
+        self.fetch_workers = fetch_workers
+        self.max_page_chars = max_page_chars # Page text is cut here before it reaches a prompt
+        self.extractor = extractor # Turns a page's HTML into text
+        self.search_cache = search_cache # Normalized query -> result links
+        self.page_cache = page_cache # Extraction settings and URL -> page text and validators
     
     def search(self, search_string, num_results=1):
         google_search_url = f"https://www.googleapis.com/customsearch/v1?key={self.api_key}&cx={self.google_cx}&q={search_string}&num={num_results}"
 
+        # Repeated queries skip the Custom Search API entirely
+        cache_key = f"{self.google_cx}|{num_results}|{' '.join(search_string.lower().split())}"
+        links = self.search_cache.get(cache_key)
+        if links is not None:
+            return self.fetch_pages(links)
+
         try:
             # Fetch the search results from Google Custom Search
-            search_response = requests.get(google_search_url, timeout=10)
+            search_response = http_client.get(google_search_url, timeout=10)
             search_response.raise_for_status()  # Raise an HTTPError if the HTTP request returned an unsuccessful status code
             data = search_response.json()
 
             if 'items' in data:
-                results = []
-                for item in data['items'][:num_results]:
-                    link = item['link']
-
-                    # Fetch the content from each search result link
-                    try:
-                        page_response = requests.get(link, timeout=30)
-                        page_response.raise_for_status()  # Raise an HTTPError for the page request if the HTTP request returned an unsuccessful status code
-                        try:
-                            # Parse the content with BeautifulSoup
-                            soup = BeautifulSoup(page_response.text, 'html.parser')
-                            page_text = soup.get_text(separator='\n', strip=True)
-                        except Exception as e:
-                            page_text = "Content could not be retrieved from page"
-                    except requests.RequestException as e:
-                        page_text = "Content could not be retrieved from page"
-
-                    results.append((link, page_text))
-                return results
+                links = [item['link'] for item in data['items'][:num_results]]
+                self.search_cache.set(cache_key, links)
+                return self.fetch_pages(links)
             else:
                 return None, "No items found in search results"
         except requests.RequestException as e:
             print(f"HTTP Request failed: {e}")
             return None, str(e)
+
+    def fetch_pages(self, links):
+        """Fetch the result pages concurrently, keeping whatever has arrived by the deadline."""
+        deadline_at = time.monotonic() + self.deadline
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.fetch_workers, len(links))))
+        futures = [executor.submit(self.fetch_page, link, deadline_at) for link in links]
+        wait(futures, timeout=self.deadline)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        results = []
+        for link, future in zip(links, futures):
+            page_text = "Content could not be retrieved from page"
+            if future.done() and not future.cancelled() and future.exception() is None:
+                page_text = future.result()
+            results.append((link, page_text))
+        return results
+
+    def page_cache_key(self, link):
+        # The cache is shared by instances with different extraction settings, so they are part of the key
+        extractor = f"{getattr(self.extractor, '__module__', '')}.{getattr(self.extractor, '__qualname__', repr(self.extractor))}"
+        return f"{extractor}|{self.max_page_chars}|{link}"
+
+    def fetch_page(self, link, deadline_at):
+        cache_key = self.page_cache_key(link)
+        cached, fresh = self.page_cache.get_entry(cache_key)
+        if fresh:
+            return cached['text']
+
+        # Revalidate a stale copy with its validators so an unchanged page isn't downloaded again
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        # Fetch the content from a search result link
+        try:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                return "Content could not be retrieved from page"
+            with http_client.get(link, headers=headers, timeout=min(30, remaining), stream=True) as page_response:
+                if page_response.status_code == 304 and cached:
+                    self.page_cache.set(cache_key, cached)
+                    return cached['text']
+                page_response.raise_for_status()  # Raise an HTTPError for the page request if the HTTP request returned an unsuccessful status code
+
+                # Read the body in chunks so huge or slow pages stop at the size limit or deadline
+                content = bytearray()
+                timed_out = False
+                for chunk in page_response.iter_content(chunk_size=65536):
+                    content.extend(chunk)
+                    if len(content) >= self.max_page_bytes:
+                        break
+                    if time.monotonic() >= deadline_at:
+                        timed_out = True
+                        break
+                html = bytes(content[:self.max_page_bytes]).decode(page_response.encoding or 'utf-8', errors='replace')
+                validators = {'etag': page_response.headers.get('ETag'), 'last_modified': page_response.headers.get('Last-Modified')}
+        except (requests.RequestException, LookupError) as e:
+            return "Content could not be retrieved from page"
+
+        try:
+            # Extract the main content of the page as text
+            page_text = self.extractor(html, max_chars=self.max_page_chars)
+        except Exception as e:
+            return "Content could not be retrieved from page"
+        # A page cut short by the deadline is used for this search only; the size limit truncates it the same way every time
+        if not timed_out:
+            self.page_cache.set(cache_key, dict(validators, text=page_text))
+        return page_text
             
 # Test Cell
 # Please do not modify
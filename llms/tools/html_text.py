@@ -0,0 +1,93 @@
+import re
+from html import escape
+from bs4 import BeautifulSoup
+
+# selectolax and lxml are optional fast parsers; BeautifulSoup's html.parser is the fallback
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Elements that never hold page content
+BOILERPLATE_TAGS = ['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'nav', 'header', 'footer', 'aside', 'form']
+
+# Containers that usually hold the main content, in order of preference
+MAIN_CONTENT_SELECTORS = ['main', '[role="main"]', 'article']
+
+# XPath equivalents of MAIN_CONTENT_SELECTORS for the lxml backend, in the same order
+MAIN_CONTENT_XPATHS = ['//main', '//*[@role="main"]', '//article']
+
+# CDATA sections, e.g. Confluence code macro bodies in <ac:plain-text-body>
+CDATA_PATTERN = re.compile(r'<!\[CDATA\[(.*?)\]\]>', re.S)
+
+# A main-content candidate with less text than this is ignored in favour of the whole body
+MIN_MAIN_CONTENT_CHARS = 200
+
+def html_to_text(html, max_chars=None, main_content=True):
+    """Convert HTML to plain text, dropping boilerplate and optionally keeping only the main content."""
+    if not html:
+        return ''
+    # HTML5 parsers drop CDATA outside SVG/MathML as a bogus comment, so turn it into escaped text first
+    html = CDATA_PATTERN.sub(lambda match: escape(match.group(1)), html)
+    if HTMLParser is not None:
+        text = _selectolax_text(html, main_content)
+    elif lxml is not None:
+        text = _lxml_text(html, main_content)
+    else:
+        text = _soup_text(html, main_content)
+
+    # Collapse runs of blank lines and whitespace left by removed elements
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\n\s*\n+', '\n', text).strip()
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars] + '... (truncated due to length)'
+    return text
+
+def _selectolax_text(html, main_content):
+    tree = HTMLParser(html)
+    tree.strip_tags(BOILERPLATE_TAGS)
+    root = tree.body or tree.root
+    if root is None:
+        return ''
+    if main_content:
+        for selector in MAIN_CONTENT_SELECTORS:
+            node = tree.css_first(selector)
+            if node is not None and len(node.text(strip=True)) >= MIN_MAIN_CONTENT_CHARS:
+                root = node
+                break
+    return root.text(separator='\n', strip=True)
+
+def _lxml_text(html, main_content):
+    try:
+        doc = lxml.html.fromstring(html)
+    except Exception:
+        return _soup_text(html, main_content)
+    for element in doc.xpath('|'.join(f'//{tag}' for tag in BOILERPLATE_TAGS)):
+        element.drop_tree()
+    root = doc
+    if main_content:
+        # One selector at a time so the same node wins as with the other backends
+        for xpath in MAIN_CONTENT_XPATHS:
+            element = next(iter(doc.xpath(xpath)), None)
+            if element is not None and len(element.text_content().strip()) >= MIN_MAIN_CONTENT_CHARS:
+                root = element
+                break
+    return '\n'.join(text.strip() for text in root.itertext() if text.strip())
+
+def _soup_text(html, main_content):
+    soup = BeautifulSoup(html, 'html.parser')
+    for element in soup(BOILERPLATE_TAGS):
+        element.decompose()
+    root = soup
+    if main_content:
+        for selector in MAIN_CONTENT_SELECTORS:
+            node = soup.select_one(selector)
+            if node is not None and len(node.get_text(strip=True)) >= MIN_MAIN_CONTENT_CHARS:
+                root = node
+                break
+    return root.get_text(separator='\n', strip=True)
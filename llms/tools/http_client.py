@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import Counter
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+class HttpClient:
+    """Shared HTTP transport that keeps connections alive in a pool per host."""
+    def __init__(self, pool_connections=None, pool_maxsize=None, timeout=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.session = None
+        self.adapter = None
+        self.request_counts = Counter()
+        self.lock = threading.Lock()
+
+    def _get_session(self):
+        # Built on first use so settings from environment.env are loaded by then
+        with self.lock:
+            if self.session is None:
+                if self.pool_connections is None:
+                    self.pool_connections = int(os.getenv('HTTP_POOL_CONNECTIONS', '20'))
+                if self.pool_maxsize is None:
+                    self.pool_maxsize = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+                if self.timeout is None:
+                    self.timeout = float(os.getenv('HTTP_TIMEOUT', '300'))
+                session = requests.Session()
+                # Don't keep cookies; the session is shared by every user and tool
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                self.adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount('https://', self.adapter)
+                session.mount('http://', self.adapter)
+                self.session = session
+            return self.session
+
+    def request(self, method, url, **kwargs):
+        session = self._get_session()
+        kwargs.setdefault('timeout', self.timeout)
+        with self.lock:
+            self.request_counts[urlsplit(url).netloc] += 1
+        return session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        """Per-host request counts and the number of connections each pool has opened."""
+        with self.lock:
+            stats = {host: {'requests': count, 'connections': 0} for host, count in self.request_counts.items()}
+        if self.adapter is None:
+            return stats
+        for pool_key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(pool_key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            host_stats = stats.setdefault(host, {'requests': 0, 'connections': 0})
+            host_stats['connections'] += pool.num_connections
+        return stats
+
+http_client = HttpClient()
@@ -1,48 +1,115 @@
 import os
-import requests
+from llms.tools.http_client import http_client
 from dotenv import load_dotenv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 class JiraSearch:
-    def __init__(self, url, api_token):
+    def __init__(self, url, api_token, fields='summary,description,status', page_size=50, prefetch_workers=4, max_chars=100000):
         self.url = url
         self.api_token = api_token
         self.headers = {
             'Authorization': f'Bearer {self.api_token}',
             'Content-Type': 'application/json'
         }
+        self.fields = fields # Only these fields are returned for each issue
+        self.page_size = page_size # Issues requested per page; JIRA caps this server side
+        self.prefetch_workers = prefetch_workers # Pages after the first are fetched concurrently
+        self.max_chars = max_chars # Budget for format_issues
 
     def search(self, jql, num_results=1):
+        try:
+            return list(self.iter_issues(jql, num_results))
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+            return "Could not retrieve search results"
+
+    def search_text(self, jql, num_results=1, label='Page Text', max_chars=None):
+        """Search and format the issues for a prompt, fetching pages only until the character budget is reached."""
+        return self.format_issues(self.iter_issues(jql, num_results), label=label, max_chars=max_chars)
+
+    def fetch_page(self, jql, start_at, max_results):
         search_url = f'{self.url}/rest/api/2/search'
         params = {
             'jql': jql,
-            'maxResults': num_results
+            'startAt': start_at,
+            'maxResults': max_results,
+            'fields': self.fields
         }
+        response = http_client.get(search_url, headers=self.headers, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_issues(self, jql, num_results=1):
+        """Yield up to num_results issues in order, prefetching a few pages ahead of the caller."""
+        first_page = self.fetch_page(jql, 0, min(self.page_size, num_results))
+        issues = first_page.get('issues', [])
+        for issue in issues:
+            yield self.issue_summary(issue)
+
+        # The server may return fewer issues per page than requested; page by what it actually returned
+        page_size = len(issues)
+        total = min(first_page.get('total', 0), num_results)
+        if page_size == 0 or total <= page_size:
+            return
+
+        starts = iter(range(page_size, total, page_size))
+        executor = ThreadPoolExecutor(max_workers=self.prefetch_workers)
+        pending = deque()
+        def submit_next():
+            start_at = next(starts, None)
+            if start_at is not None:
+                pending.append(executor.submit(self.fetch_page, jql, start_at, min(page_size, total - start_at)))
 
         try:
-            response = requests.get(search_url, headers=self.headers, params=params)
-            response.raise_for_status()
-            search_results = response.json().get('issues', [])
+            for _ in range(self.prefetch_workers):
+                submit_next()
+            while pending:
+                page = pending.popleft().result()
+                submit_next()
+                for issue in page.get('issues', []):
+                    yield self.issue_summary(issue)
+        finally:
+            # Stop fetching once the caller has enough or a page failed
+            executor.shutdown(wait=False, cancel_futures=True)
 
-            #print(f"Search URL: {search_url}")
-            #print(f"Params: {params}")
-            #print(f"Response Status Code: {response.status_code}")
-            #print(f"Response JSON: {response.json()}")
+    def issue_summary(self, issue):
+        fields = issue.get('fields', {})
+        return {
+            'key': issue.get('key'),
+            'summary': fields.get('summary', ''),
+            'description': fields.get('description', ''),
+            'status': (fields.get('status') or {}).get('name', '')
+        }
 
-            issue_summaries = []
-            for issue in search_results:
-                issue_key = issue.get('key')
-                issue_summary = issue.get('fields', {}).get('summary', '')
-                issue_description = issue.get('fields', {}).get('description', '')
-                issue_summaries.append({
-                    'key': issue_key,
-                    'summary': issue_summary,
-                    'description': issue_description
-                })
+    def format_issues(self, issues, label='Page Text', max_chars=None):
+        """Format issues for a prompt, stopping before the character budget is exceeded.
 
-            return issue_summaries
+        issues may be a list or an iter_issues generator, which is only consumed as far as the budget allows.
+        """
+        if isinstance(issues, str):
+            return issues
+        max_chars = max_chars or self.max_chars
+        lines = []
+        used = 0
+        try:
+            for issue in issues:
+                line = f"{label}: {issue}\n"
+                if used + len(line) > max_chars:
+                    lines.append("... (more issues truncated due to length)\n")
+                    break
+                lines.append(line)
+                used += len(line)
         except Exception as e:
             print(f"An error occurred: {str(e)}")
-            return "Could not retrieve search results"
+            if not lines:
+                return "Could not retrieve search results"
+            # Keep the issues already fetched
+            lines.append(f"... (could not retrieve the remaining issues: {e})\n")
+        finally:
+            if hasattr(issues, 'close'):
+                issues.close()
+        return ''.join(lines)
 
 # Test Cell
 # Please do not modify
@@ -0,0 +1,159 @@
+import os
+import re
+import sqlite3
+import threading
+import weakref
+
+class MailStore:
+    """Per-user SQLite copy of mail and calendar metadata, searched locally with full-text search.
+
+    The mail clients keep it current with incremental syncs (Graph delta queries, Gmail history ids).
+    """
+    stores = weakref.WeakSet() # Open stores, so a user's data can be removed while clients hold it
+
+    def __init__(self, user, path=None):
+        self.path = path or self.store_path(user)
+        self.lock = threading.Lock()
+        self.fts = True
+        self.connect()
+        MailStore.stores.add(self)
+
+    @staticmethod
+    def store_path(user):
+        return f'{user}_mail_store.db'
+
+    @staticmethod
+    def remove(path):
+        """Delete a store's database file and its journal."""
+        for file in [path, f'{path}-journal', f'{path}-wal', f'{path}-shm']:
+            if os.path.exists(file):
+                os.remove(file)
+
+    @classmethod
+    def clear_user(cls, user):
+        """Remove a user's mail store from disk; open stores for the user start over empty."""
+        path = cls.store_path(user)
+        open_stores = [store for store in list(cls.stores) if store.path == path]
+        for store in open_stores:
+            with store.lock:
+                store.conn.close()
+        cls.remove(path)
+        for store in open_stores:
+            store.connect()
+
+    def connect(self):
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS messages (provider TEXT, id TEXT, subject TEXT, sender TEXT, received TEXT, preview TEXT, folder TEXT, PRIMARY KEY (provider, id))')
+            # Stores created before messages recorded their folder
+            if 'folder' not in [row[1] for row in self.conn.execute('PRAGMA table_info(messages)')]:
+                self.conn.execute('ALTER TABLE messages ADD COLUMN folder TEXT')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS events (provider TEXT, id TEXT, subject TEXT, start TEXT, end TEXT, location TEXT, PRIMARY KEY (provider, id))')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS messages_received ON messages (provider, received)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS events_start ON events (provider, start)')
+            try:
+                self.conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(subject, sender, preview, provider UNINDEXED, id UNINDEXED)')
+                self.conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(subject, location, provider UNINDEXED, id UNINDEXED)')
+            except sqlite3.OperationalError as e:
+                # SQLite built without FTS5; fall back to LIKE matching
+                print(f"Full-text search not available, using LIKE matching: {e}")
+                self.fts = False
+
+    @staticmethod
+    def is_plain_query(query):
+        """True for '*' or plain keywords; search operators (from:, OR, quotes, -term, prefix*) are left to the provider."""
+        if not query or query.strip() == '*':
+            return True
+        return not re.search(r'[:"()*{}]|(^|\s)-|\b(AND|OR|NOT)\b', query)
+
+    def get_state(self, name):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM sync_state WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, name, value):
+        with self.lock, self.conn:
+            if value is None:
+                self.conn.execute('DELETE FROM sync_state WHERE name = ?', (name,))
+            else:
+                self.conn.execute('INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)', (name, value))
+
+    def clear(self, provider, table):
+        with self.lock, self.conn:
+            self.conn.execute(f'DELETE FROM {table} WHERE provider = ?', (provider,))
+            if self.fts:
+                self.conn.execute(f'DELETE FROM {table}_fts WHERE provider = ?', (provider,))
+
+    def upsert_messages(self, provider, messages):
+        """Store messages given as dicts with id, subject, sender, received (ISO UTC), preview and optionally folder."""
+        with self.lock, self.conn:
+            for message in messages:
+                row = (provider, message['id'], message.get('subject') or '', message.get('sender') or '', message.get('received') or '', message.get('preview') or '', message.get('folder') or '')
+                self.conn.execute('INSERT OR REPLACE INTO messages (provider, id, subject, sender, received, preview, folder) VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+                if self.fts:
+                    self.conn.execute('DELETE FROM messages_fts WHERE provider = ? AND id = ?', (provider, message['id']))
+                    self.conn.execute('INSERT INTO messages_fts (subject, sender, preview, provider, id) VALUES (?, ?, ?, ?, ?)', (row[2], row[3], row[5], provider, row[1]))
+
+    def delete_messages(self, provider, message_ids):
+        with self.lock, self.conn:
+            for message_id in message_ids:
+                self.conn.execute('DELETE FROM messages WHERE provider = ? AND id = ?', (provider, message_id))
+                if self.fts:
+                    self.conn.execute('DELETE FROM messages_fts WHERE provider = ? AND id = ?', (provider, message_id))
+
+    def clear_folder(self, provider, folder):
+        """Remove every message of one folder, e.g. before downloading it again."""
+        message_ids = [row[0] for row in self.query('SELECT id FROM messages WHERE provider = ? AND folder = ?', [provider, folder])]
+        self.delete_messages(provider, message_ids)
+
+    def upsert_events(self, provider, events):
+        """Store events given as dicts with id, subject, start, end (ISO UTC) and location."""
+        with self.lock, self.conn:
+            for event in events:
+                row = (provider, event['id'], event.get('subject') or '', event.get('start') or '', event.get('end') or '', event.get('location') or '')
+                self.conn.execute('INSERT OR REPLACE INTO events (provider, id, subject, start, end, location) VALUES (?, ?, ?, ?, ?, ?)', row)
+                if self.fts:
+                    self.conn.execute('DELETE FROM events_fts WHERE provider = ? AND id = ?', (provider, event['id']))
+                    self.conn.execute('INSERT INTO events_fts (subject, location, provider, id) VALUES (?, ?, ?, ?)', (row[2], row[5], provider, row[1]))
+
+    def delete_events(self, provider, event_ids):
+        with self.lock, self.conn:
+            for event_id in event_ids:
+                self.conn.execute('DELETE FROM events WHERE provider = ? AND id = ?', (provider, event_id))
+                if self.fts:
+                    self.conn.execute('DELETE FROM events_fts WHERE provider = ? AND id = ?', (provider, event_id))
+
+    def search_messages(self, provider, query, start_date, end_date, limit=100):
+        """Newest messages received in [start_date, end_date] that match every word of the query."""
+        sql, params = self.match_clause('messages', ['subject', 'sender', 'preview'], query)
+        rows = self.query(
+            f'SELECT id, subject, sender, received, preview FROM messages WHERE provider = ? AND received >= ? AND received <= ?{sql} ORDER BY received DESC LIMIT ?',
+            [provider, start_date, end_date] + params + [limit])
+        return [dict(zip(['id', 'subject', 'sender', 'received', 'preview'], row)) for row in rows]
+
+    def search_events(self, provider, query, start_date, end_date, limit=100):
+        """Events overlapping [start_date, end_date] that match every word of the query, in start order."""
+        sql, params = self.match_clause('events', ['subject', 'location'], query)
+        rows = self.query(
+            f'SELECT id, subject, start, end, location FROM events WHERE provider = ? AND end >= ? AND start <= ?{sql} ORDER BY start LIMIT ?',
+            [provider, start_date, end_date] + params + [limit])
+        return [dict(zip(['id', 'subject', 'start', 'end', 'location'], row)) for row in rows]
+
+    def query(self, sql, params):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def match_clause(self, table, columns, query):
+        words = re.findall(r'\w+', query or '')
+        if not words:
+            return '', []
+        if self.fts:
+            # Quote each word so user text can't be read as FTS5 syntax
+            match = ' '.join(f'"{word}"' for word in words)
+            return f' AND id IN (SELECT id FROM {table}_fts WHERE {table}_fts MATCH ? AND provider = {table}.provider)', [match]
+        clauses, params = [], []
+        for word in words:
+            clauses.append('(' + ' OR '.join(f'{column} LIKE ?' for column in columns) + ')')
+            params.extend([f'%{word}%'] * len(columns))
+        return ' AND ' + ' AND '.join(clauses), params
@@ -1,6 +1,7 @@
 import os
 import dotenv
 import requests
+from llms.tools.http_client import http_client
 
 class NotionAPI:
     BASE_URL = "https://api.notion.com/v1"
@@ -20,7 +21,7 @@ class NotionAPI:
             data["filter"] = filter
         if sorts:
             data["sorts"] = sorts
-        response = requests.post(url, headers=self.headers)
+        response = http_client.post(url, headers=self.headers)
         if response.status_code == 200:
             return response.json()
         else:
@@ -29,7 +30,7 @@ class NotionAPI:
     def retrieve_block_children(self, page_id):
         page_text_dump = ""
         url = f"{self.BASE_URL}/blocks/{page_id}/children"
-        response = requests.get(url, headers=self.headers)
+        response = http_client.get(url, headers=self.headers)
         if response.status_code == 200:
             for block in response.json()['results']:
                 if block['type'] == 'paragraph':
@@ -1,7 +1,9 @@
 import os
 import time
+import threading
 import msal
-import requests
+from llms.tools.http_client import http_client
+from llms.tools.mail_store import MailStore
 import webbrowser
 import pickle
 import json
@@ -39,75 +41,146 @@ from datetime import datetime, timedelta, timezone
     # Client Secret: The value you copied in the previous step.
     # Tenant ID: Found in the Overview section of your Azure AD.
 
+class OutlookCredentials:
+    """One long-lived MSAL app and token cache per user, shared by every OutlookClient for that user."""
+    scopes = ["https://graph.microsoft.com/.default"]
+    credentials = {}
+    credentials_lock = threading.Lock()
+
+    @classmethod
+    def for_user(cls, user, client_id, client_secret, tenant_id):
+        with cls.credentials_lock:
+            if user not in cls.credentials:
+                cls.credentials[user] = cls(user, client_id, client_secret, tenant_id)
+            return cls.credentials[user]
+
+    def __init__(self, user, client_id, client_secret, tenant_id):
+        self.token_file = f'{user}_365_token.pickle'
+        self.refresh_margin = 300 # Refresh this many seconds before the access token expires
+        self.token = None
+        self.expires_at = 0
+        self.lock = threading.Lock()
+        self.cache = msal.SerializableTokenCache()
+        self.load_cache()
+        self.app = msal.ConfidentialClientApplication(
+            client_id,
+            authority=f"https://login.microsoftonline.com/{tenant_id}",
+            client_credential=client_secret,
+            token_cache=self.cache
+        )
+
+    def load_cache(self):
+        # The token file holds the serialized MSAL cache and is only read when the credentials are created
+        if os.path.exists(self.token_file):
+            try:
+                with open(self.token_file, 'rb') as f:
+                    data = pickle.load(f)
+                if isinstance(data, str):
+                    self.cache.deserialize(data)
+            except Exception as e:
+                print(f"Could not load Outlook token cache: {e}")
+
+    def save_cache(self):
+        if self.cache.has_state_changed:
+            with open(self.token_file, 'wb') as f:
+                pickle.dump(self.cache.serialize(), f)
+
+    def set_token(self, result):
+        self.token = result
+        self.expires_at = time.time() + int(result.get('expires_in', 0))
+        self.save_cache()
+
+    def get_token(self):
+        """Return the current token, refreshing it silently shortly before it expires."""
+        if self.token and time.time() < self.expires_at - self.refresh_margin:
+            return self.token
+        with self.lock:
+            if not (self.token and time.time() < self.expires_at - self.refresh_margin):
+                self.refresh()
+            return self.token
+
+    def refresh(self, force=False):
+        accounts = self.app.get_accounts()
+        result = None
+        if accounts:
+            result = self.app.acquire_token_silent_with_error(self.scopes, account=accounts[0], force_refresh=force)
+        if result and "access_token" in result:
+            self.set_token(result)
+        else:
+            self.token = None
+            self.expires_at = 0
+
+    def invalidate(self):
+        """Called when Graph rejects the token: force a refresh, and forget the account if that fails too."""
+        with self.lock:
+            self.refresh(force=True)
+            if not self.token:
+                for account in self.app.get_accounts():
+                    self.app.remove_account(account)
+                if os.path.exists(self.token_file):
+                    os.remove(self.token_file)
+
+    def acquire_token_by_authorization_code(self, authorization_code, redirect_uri):
+        with self.lock:
+            result = self.app.acquire_token_by_authorization_code(
+                authorization_code,
+                scopes=self.scopes,
+                redirect_uri=redirect_uri
+            )
+            if "access_token" in result:
+                self.set_token(result)
+            else:
+                raise Exception("Could not obtain access token")
+
 class OutlookClient:
+    initial_sync_threads = {} # Background initial syncs by (store path, 'mail' or 'calendar')
+    initial_sync_lock = threading.Lock()
+
     def __init__(self, user):
         load_dotenv('environment.env')
         self.client_id = os.getenv('OUTLOOK_CLIENT_ID')
         self.client_secret = os.getenv('OUTLOOK_CLIENT_SECRET')
         self.tenant_id = os.getenv('OUTLOOK_TENANT_ID')
         self.redirect_uri = 'http://localhost'
-        self.token = None
+        self.credentials = OutlookCredentials.for_user(user, self.client_id, self.client_secret, self.tenant_id)
         self.credentials_file = f'{user}_outlook_credentials.json'
         self.token_file = f'{user}_365_token.pickle'
+        self.max_retries = 3 # Retries for throttled Graph requests
+
+        # Local mail and calendar store kept current with Graph delta queries
+        self.use_local_store = True
+        self.store = MailStore(user)
+        self.sync_folders = ['inbox', 'sentitems']
+        self.sync_days = 365 # Mail received and events starting this far back (and ahead) are kept locally
+        self.sync_interval = 30 # Minimum seconds between delta syncs
+        self.last_mail_sync = 0
+        self.last_calendar_sync = 0
         self.login()
 
+    @property
+    def token(self):
+        # Served from memory; MSAL is only asked for a new token when this one is about to expire
+        return self.credentials.get_token()
+
     def get_msal_app(self):
-        return msal.ConfidentialClientApplication(
-            self.client_id,
-            authority=f"https://login.microsoftonline.com/{self.tenant_id}",
-            client_credential=self.client_secret
-        )
+        return self.credentials.app
 
     def get_authorization_url(self):
         auth_url = self.get_msal_app().get_authorization_request_url(
-            scopes=["https://graph.microsoft.com/.default"],
+            scopes=OutlookCredentials.scopes,
             redirect_uri=self.redirect_uri
         )
         return auth_url
 
     def acquire_token_by_authorization_code(self, authorization_code):
-        result = self.get_msal_app().acquire_token_by_authorization_code(
-            authorization_code,
-            scopes=["https://graph.microsoft.com/.default"],
-            redirect_uri=self.redirect_uri
-        )
-        if "access_token" in result:
-            self.token = result
-            self.save_token(result)
-        else:
-            raise Exception("Could not obtain access token")
-
-    def save_token(self, token):
-        with open(self.token_file, 'wb') as f:
-            pickle.dump(token, f)
-
-    def load_token(self):
-        if os.path.exists(self.token_file):
-            with open(self.token_file, 'rb') as f:
-                token = pickle.load(f)
-                return token
-        return None
+        self.credentials.acquire_token_by_authorization_code(authorization_code, self.redirect_uri)
 
     def refresh_token_if_needed(self, error=None):
-        # If the token is invalid, delete the pickle file and refresh the token
+        # If the token is invalid, force a refresh (signing out if that fails); otherwise refresh only near expiry
         if error == "InvalidAuthenticationToken":
-            os.remove(self.token_file)
-            self.token = None
-
-        token = self.load_token()
-        if token:
-            self.token = token
-            account = self.get_msal_app().get_accounts()
-            if account:
-                result = self.get_msal_app().acquire_token_silent_with_error(
-                    scopes=["https://graph.microsoft.com/.default"],
-                    account=account[0]
-                )
-                if "access_token" in result:
-                    self.token = result
-                    self.save_token(result)
-                else:
-                    self.token = None
+            self.credentials.invalidate()
+        else:
+            self.credentials.get_token()
 
     def login(self):
         self.refresh_token_if_needed()
@@ -128,7 +201,25 @@ class OutlookClient:
         else:
             raise Exception("Authorization code not found in the URL.")
 
-    def search_emails(self, search_query=None, start_date=None, end_date=None):
+    def graph_get(self, endpoint, headers, params=None):
+        return self.graph_request('GET', endpoint, headers, params=params)
+
+    def graph_request(self, method, endpoint, headers, **kwargs):
+        # Back off on throttling for as long as Graph asks via Retry-After
+        for attempt in range(self.max_retries + 1):
+            response = http_client.request(method, endpoint, headers=headers, **kwargs)
+            if response.status_code not in (429, 503, 504) or attempt == self.max_retries:
+                return response
+            retry_after = response.headers.get('Retry-After')
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = 2 ** attempt
+            print(f"Graph throttled the request ({response.status_code}), retrying in {delay} seconds")
+            time.sleep(delay)
+        return response
+
+    def search_emails(self, search_query=None, start_date=None, end_date=None, max_results=100):
         if not self.token:
             raise Exception("Access token is not available. Please authenticate first.")
         
@@ -157,18 +248,48 @@ class OutlookClient:
             # Default to current date
             end_date = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
         
-        endpoint = f"https://graph.microsoft.com/v1.0/me/messages?$search=\"{search_query}\""
+        # KQL queries (from:, OR, ...) always go to Graph. The store only holds subjects, senders and previews
+        # from the synced folders, so it answers a search only when it fills the page; otherwise Graph may have
+        # matches in other folders or message bodies
+        if self.use_local_store and self.store.is_plain_query(search_query):
+            try:
+                self.sync_mail()
+                sync_start = self.store.get_state('outlook_mail_sync_start')
+                if sync_start and start_date >= sync_start:
+                    messages = self.store.search_messages('outlook', '' if search_query == "*" else search_query, start_date, end_date, max_results)
+                    if len(messages) >= max_results:
+                        return [{
+                            'id': message['id'],
+                            'subject': message['subject'],
+                            'receivedDateTime': message['received'],
+                            'from': {'emailAddress': {'address': message['sender']}}
+                        } for message in messages]
+            except Exception as e:
+                print(f"Local mail store unavailable, searching Graph instead: {e}")
+
+        endpoint = "https://graph.microsoft.com/v1.0/me/messages"
+        params = {
+            '$select': 'id,subject,from,receivedDateTime',
+            '$top': min(max_results, 50)
+        }
+        if search_query == "*":
+            # No keywords: filter and sort by date on the server
+            params['$filter'] = f"receivedDateTime ge {start_date} and receivedDateTime le {end_date}"
+            params['$orderby'] = 'receivedDateTime desc'
+        else:
+            # Graph can't combine $search with $filter on messages, so the date range goes into the KQL query
+            params['$search'] = f'"{search_query} AND received>={start_date[:10]} AND received<={end_date[:10]}"'
         headers = {'Authorization': f'Bearer {self.token["access_token"]}'}
         
         emails = []
-        while endpoint:
-            response = requests.get(endpoint, headers=headers)
+        while endpoint and len(emails) < max_results:
+            response = self.graph_get(endpoint, headers, params)
             if response.status_code == 200:
                 response_data = response.json()
                 emails.extend(response_data['value'])
+                # The next link already carries the query options
                 endpoint = response_data.get('@odata.nextLink')
-                # Wait for 1 second before making the next request
-                time.sleep(1)
+                params = None
             else:
                 # If response.text containt "InvalidAuthenticationToken" then refresh token
                 if "InvalidAuthenticationToken" in response.text:
@@ -177,38 +298,268 @@ class OutlookClient:
                 else:
                     raise Exception(f"Error retrieving emails: {response.status_code}, {response.text}")
 
-        # Manually filter emails by date range
+        # KQL matches whole days, so trim to the exact date range
         filtered_emails = [
             email for email in emails
             if start_date <= email['receivedDateTime'] <= end_date
         ]
-        return filtered_emails
+        return filtered_emails[:max_results]
+
+
+    def sync_mail(self):
+        """Apply mailbox changes since the last sync to the local store.
+
+        The first sync downloads the sync window in a background thread, resuming from its saved next link if
+        it was interrupted. Searches go to Graph until it completes.
+        """
+        if not self.store.get_state('outlook_mail_sync_start'):
+            self.start_initial_sync('mail')
+            return
+        if time.time() - self.last_mail_sync < self.sync_interval:
+            return
+        self.sync_mail_folders(self.store.get_state('outlook_mail_sync_start'))
+        self.last_mail_sync = time.time()
+
+    def start_initial_sync(self, kind):
+        # One download per mailbox or calendar, even when several agents hold a client for the same user
+        with OutlookClient.initial_sync_lock:
+            key = (self.store.path, kind)
+            thread = OutlookClient.initial_sync_threads.get(key)
+            if thread and thread.is_alive():
+                return
+            # A failed download is retried after sync_interval
+            if time.time() - getattr(self, f'last_{kind}_sync') < self.sync_interval:
+                return
+            thread = threading.Thread(target=getattr(self, f'initial_{kind}_sync'), daemon=True)
+            OutlookClient.initial_sync_threads[key] = thread
+            thread.start()
+
+    def initial_mail_sync(self):
+        try:
+            sync_start = self.store.get_state('outlook_mail_sync_pending_start')
+            if not sync_start:
+                sync_start = (datetime.now(timezone.utc) - timedelta(days=self.sync_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+                self.store.set_state('outlook_mail_sync_pending_start', sync_start)
+            self.sync_mail_folders(sync_start)
+            # The store only answers searches once every folder has been downloaded
+            if all(self.store.get_state(f'outlook_mail_delta_{folder}') for folder in self.sync_folders):
+                self.store.set_state('outlook_mail_sync_start', sync_start)
+                self.store.set_state('outlook_mail_sync_pending_start', None)
+        except Exception as e:
+            print(f"Initial mail sync stopped, it resumes on a later search: {e}")
+        finally:
+            self.last_mail_sync = time.time()
+
+    def sync_mail_folders(self, sync_start):
+        for folder in self.sync_folders:
+            state_name = f'outlook_mail_delta_{folder}'
+            next_name = f'outlook_mail_next_{folder}'
+            # A saved next link resumes an interrupted download; a delta link fetches changes since the last sync
+            endpoint = self.store.get_state(next_name) or self.store.get_state(state_name)
+            params = None
+            if not endpoint:
+                endpoint = f'https://graph.microsoft.com/v1.0/me/mailFolders/{folder}/messages/delta'
+                params = {
+                    '$select': 'subject,from,receivedDateTime,bodyPreview',
+                    '$filter': f'receivedDateTime ge {sync_start}'
+                }
+
+            while endpoint:
+                # Headers are built per page so a long download picks up refreshed tokens
+                headers = {
+                    'Authorization': f'Bearer {self.token["access_token"]}',
+                    'Prefer': 'odata.maxpagesize=100'
+                }
+                response = self.graph_get(endpoint, headers, params)
+                params = None
+                if response.status_code == 410:
+                    # The delta token expired; drop the folder's messages, since deletions since then were
+                    # missed, and download it again in the background
+                    self.store.set_state('outlook_mail_sync_start', None)
+                    self.store.set_state(state_name, None)
+                    self.store.set_state(next_name, None)
+                    self.store.clear_folder('outlook', folder)
+                    break
+                if response.status_code != 200:
+                    if "InvalidAuthenticationToken" in response.text:
+                        self.refresh_token_if_needed("InvalidAuthenticationToken")
+                    raise Exception(f"Error syncing mail: {response.status_code}, {response.text}")
+                response_data = response.json()
+                changes = response_data.get('value', [])
+                self.store.delete_messages('outlook', [item['id'] for item in changes if '@removed' in item])
+                self.store.upsert_messages('outlook', [{
+                    'id': item['id'],
+                    'folder': folder,
+                    'subject': item.get('subject'),
+                    'sender': item.get('from', {}).get('emailAddress', {}).get('address'),
+                    'received': item.get('receivedDateTime'),
+                    'preview': item.get('bodyPreview')
+                } for item in changes if '@removed' not in item])
+                endpoint = response_data.get('@odata.nextLink')
+                if endpoint:
+                    self.store.set_state(next_name, endpoint)
+                else:
+                    self.store.set_state(state_name, response_data.get('@odata.deltaLink'))
+                    self.store.set_state(next_name, None)
+
+    def sync_calendar(self):
+        """Apply calendar changes since the last sync to the local store.
+
+        The first sync downloads the sync window in a background thread, like sync_mail. Searches go to
+        Graph until it completes.
+        """
+        if not self.store.get_state('outlook_calendar_delta'):
+            self.start_initial_sync('calendar')
+            return
+        if time.time() - self.last_calendar_sync < self.sync_interval:
+            return
+        self.sync_calendar_events()
+        self.last_calendar_sync = time.time()
+
+    def initial_calendar_sync(self):
+        try:
+            window = self.store.get_state('outlook_calendar_pending_window')
+            if not window:
+                window_start = (datetime.now(timezone.utc) - timedelta(days=self.sync_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+                window_end = (datetime.now(timezone.utc) + timedelta(days=self.sync_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+                window = f'{window_start}|{window_end}'
+                self.store.clear('outlook', 'events')
+                self.store.set_state('outlook_calendar_next', None)
+                self.store.set_state('outlook_calendar_pending_window', window)
+            window_start, window_end = window.split('|')
+            self.sync_calendar_events(window_start, window_end)
+            # The window is published only once the download completes, so searches don't see a partial calendar
+            if self.store.get_state('outlook_calendar_delta'):
+                self.store.set_state('outlook_calendar_window_start', window_start)
+                self.store.set_state('outlook_calendar_window_end', window_end)
+                self.store.set_state('outlook_calendar_pending_window', None)
+        except Exception as e:
+            print(f"Initial calendar sync stopped, it resumes on a later search: {e}")
+        finally:
+            self.last_calendar_sync = time.time()
+
+    def sync_calendar_events(self, window_start=None, window_end=None):
+        # A saved next link resumes an interrupted download; a delta link fetches changes since the last sync
+        endpoint = self.store.get_state('outlook_calendar_next') or self.store.get_state('outlook_calendar_delta')
+        params = None
+        if not endpoint:
+            endpoint = 'https://graph.microsoft.com/v1.0/me/calendarView/delta'
+            params = {'startDateTime': window_start, 'endDateTime': window_end}
+
+        while endpoint:
+            headers = {
+                'Authorization': f'Bearer {self.token["access_token"]}',
+                'Prefer': 'odata.maxpagesize=100'
+            }
+            response = self.graph_get(endpoint, headers, params)
+            params = None
+            if response.status_code == 410:
+                # The delta token expired; download the calendar again in the background
+                for name in ['outlook_calendar_delta', 'outlook_calendar_next', 'outlook_calendar_pending_window',
+                             'outlook_calendar_window_start', 'outlook_calendar_window_end']:
+                    self.store.set_state(name, None)
+                break
+            if response.status_code != 200:
+                if "InvalidAuthenticationToken" in response.text:
+                    self.refresh_token_if_needed("InvalidAuthenticationToken")
+                raise Exception(f"Error syncing calendar: {response.status_code}, {response.text}")
+            response_data = response.json()
+            changes = response_data.get('value', [])
+            self.store.delete_events('outlook', [item['id'] for item in changes if '@removed' in item])
+            # Delta returns UTC times without a zone suffix
+            self.store.upsert_events('outlook', [{
+                'id': item['id'],
+                'subject': item.get('subject'),
+                'start': item.get('start', {}).get('dateTime', '')[:19] + 'Z',
+                'end': item.get('end', {}).get('dateTime', '')[:19] + 'Z',
+                'location': item.get('location', {}).get('displayName')
+            } for item in changes if '@removed' not in item])
+            endpoint = response_data.get('@odata.nextLink')
+            if endpoint:
+                self.store.set_state('outlook_calendar_next', endpoint)
+            else:
+                self.store.set_state('outlook_calendar_delta', response_data.get('@odata.deltaLink'))
+                self.store.set_state('outlook_calendar_next', None)
+
+    def graph_batch(self, batch_requests):
+        """Send requests through Graph's $batch endpoint, 20 per call, and return the responses in request order."""
+        headers = {
+            'Authorization': f'Bearer {self.token["access_token"]}',
+            'Content-Type': 'application/json'
+        }
+        responses = [None] * len(batch_requests)
+        for offset in range(0, len(batch_requests), 20):
+            pending = {str(offset + i): request for i, request in enumerate(batch_requests[offset:offset + 20])}
+            for attempt in range(self.max_retries + 1):
+                body = {'requests': [dict(request, id=request_id) for request_id, request in pending.items()]}
+                response = self.graph_request('POST', 'https://graph.microsoft.com/v1.0/$batch', headers, json=body)
+                if response.status_code != 200:
+                    # If response.text containt "InvalidAuthenticationToken" then refresh token
+                    if "InvalidAuthenticationToken" in response.text:
+                        self.refresh_token_if_needed("InvalidAuthenticationToken")
+                        raise Exception("Token refreshed. Please try again.")
+                    raise Exception(f"Error sending batch request: {response.status_code}, {response.text}")
+
+                # Requests throttled inside the batch are resent after the longest Retry-After
+                throttled = {}
+                delay = 0
+                for item in response.json().get('responses', []):
+                    if item.get('status') == 429 and attempt < self.max_retries:
+                        throttled[item['id']] = pending[item['id']]
+                        try:
+                            delay = max(delay, float(item.get('headers', {}).get('Retry-After')))
+                        except (TypeError, ValueError):
+                            delay = max(delay, 2 ** attempt)
+                    else:
+                        responses[int(item['id'])] = item
+                if not throttled:
+                    break
+                pending = throttled
+                time.sleep(delay)
+        return responses
+
+    def format_email(self, message_id, message):
+        subject = message.get('subject', 'No subject found.')
+        sender_info = message.get('from', {}).get('emailAddress', {})
+        sender = sender_info.get('address', 'No sender found.')
+
+        to_recipients = message.get('toRecipients', [])
+        if to_recipients:
+            to = to_recipients[0].get('emailAddress', {}).get('address', 'No recipient found.')
+        else:
+            to = 'No recipient found.'
+
+        date = message.get('receivedDateTime', 'No date found.')
+        body = message.get('body', {}).get('content', 'No message body found.')
+        email_link = f"https://outlook.office.com/mail/deeplink/compose/{message_id}"
+        print({subject})
+        return f'subject: {subject}, sender: {sender}, to: {to}, date: {date}, message: {body}, link: {email_link}'
 
+    def get_emails_details(self, message_ids):
+        """Get the details of several emails in as few round trips as possible."""
+        if not self.token:
+            raise Exception("Access token is not available. Please authenticate first.")
+        if len(message_ids) == 1:
+            return [self.get_email_details(message_ids[0])]
+        responses = self.graph_batch([{'method': 'GET', 'url': f'/me/messages/{message_id}'} for message_id in message_ids])
+        details = []
+        for message_id, response in zip(message_ids, responses):
+            if response and response.get('status') == 200:
+                details.append(self.format_email(message_id, response.get('body', {})))
+            else:
+                status = response.get('status') if response else 'no response'
+                details.append(f"Error retrieving email {message_id}: {status}")
+        return details
 
     def get_email_details(self, message_id):
         if not self.token:
             raise Exception("Access token is not available. Please authenticate first.")
         endpoint = f"https://graph.microsoft.com/v1.0/me/messages/{message_id}"
         headers = {'Authorization': f'Bearer {self.token["access_token"]}'}
-        response = requests.get(endpoint, headers=headers)
+        response = self.graph_get(endpoint, headers)
 
         if response.status_code == 200:
-                message = response.json()
-                subject = message.get('subject', 'No subject found.')
-                sender_info = message.get('from', {}).get('emailAddress', {})
-                sender = sender_info.get('address', 'No sender found.')
-
-                to_recipients = message.get('toRecipients', [])
-                if to_recipients:
-                    to = to_recipients[0].get('emailAddress', {}).get('address', 'No recipient found.')
-                else:
-                    to = 'No recipient found.'
-
-                date = message.get('receivedDateTime', 'No date found.')
-                body = message.get('body', {}).get('content', 'No message body found.')
-                email_link = f"https://outlook.office.com/mail/deeplink/compose/{message_id}"
-                print({subject})
-                return f'subject: {subject}, sender: {sender}, to: {to}, date: {date}, message: {body}, link: {email_link}'
+                return self.format_email(message_id, response.json())
         else:
                 # If response.text containt "InvalidAuthenticationToken" then refresh token
                 if "InvalidAuthenticationToken" in response.text:
@@ -246,6 +597,26 @@ class OutlookClient:
             # Default to 30 days in the future
             end_date = (datetime.now(timezone.utc) + timedelta(days=30)).strftime('%Y-%m-%dT%H:%M:%SZ')
 
+        # The store holds every event in the window, but only subjects and locations are indexed, so a
+        # keyword search falls back to Graph unless it fills the page. KQL queries always go to Graph
+        if self.use_local_store and self.store.is_plain_query(search_query):
+            try:
+                self.sync_calendar()
+                window_start = self.store.get_state('outlook_calendar_window_start')
+                window_end = self.store.get_state('outlook_calendar_window_end')
+                if window_start and window_start <= start_date and end_date <= window_end:
+                    events = self.store.search_events('outlook', '' if search_query == "*" else search_query, start_date, end_date, 101)
+                    if search_query == "*" or len(events) > 100:
+                        return [{
+                            'id': event['id'],
+                            'subject': event['subject'],
+                            'start': {'dateTime': event['start'], 'timeZone': 'UTC'},
+                            'end': {'dateTime': event['end'], 'timeZone': 'UTC'},
+                            'location': {'displayName': event['location']}
+                        } for event in events]
+            except Exception as e:
+                print(f"Local calendar store unavailable, searching Graph instead: {e}")
+
         endpoint = f"https://graph.microsoft.com/v1.0/me/calendarView?startDateTime={start_date}&endDateTime={end_date}"
         if search_query:
             endpoint += f"&$search=\"{search_query}\""
@@ -254,7 +625,7 @@ class OutlookClient:
         
         events = []
         while endpoint:
-            response = requests.get(endpoint, headers=headers)
+            response = self.graph_get(endpoint, headers)
             if response.status_code == 200:
                 response_data = response.json()
                 events.extend(response_data['value'])
@@ -263,8 +634,6 @@ class OutlookClient:
                 # Break if more than 100 events are found
                 if len(events) > 100:
                     break
-                # Wait for 1 second before making the next request
-                time.sleep(1)
             else:
                 # If response.text containt "InvalidAuthenticationToken" then refresh token
                 if "InvalidAuthenticationToken" in response.text:
@@ -276,8 +645,12 @@ class OutlookClient:
         return events
 
     def check_room_availability(self, room_email, start_time, end_time):
+        # Several comma separated addresses are checked in one getSchedule call
+        return self.check_availability([email.strip() for email in room_email.split(',') if email.strip()], start_time, end_time)
+
+    def check_availability(self, emails, start_time, end_time):
         body = {
-            "schedules": [room_email],
+            "schedules": emails,
             "startTime": {
                 "dateTime": start_time,
                 "timeZone": 'Eastern Standard Time'
@@ -293,18 +666,23 @@ class OutlookClient:
             'Authorization': f'Bearer {self.token["access_token"]}',
             'Content-Type': 'application/json'
         }
-        response = requests.post(f'https://graph.microsoft.com/v1.0/me/calendar/getSchedule', headers=headers, json=body)
+        response = self.graph_request('POST', f'https://graph.microsoft.com/v1.0/me/calendar/getSchedule', headers, json=body)
         response.raise_for_status()
         if response.status_code == 200:
             availability = json.loads(response.text)
-            # Extract the schedule items
-            schedule_items = availability['value'][0]['scheduleItems']
-            # Create a list of scheduled items
-            scheduled_list = ""
-
-            for item in schedule_items:
-                scheduled_list += f"{item['status']} from {item['start']['dateTime']} to {item['end']['dateTime']} EST\n"
-            return scheduled_list
+            schedules = []
+            for schedule in availability['value']:
+                # Extract the schedule items
+                schedule_items = schedule.get('scheduleItems', [])
+                # Create a list of scheduled items
+                scheduled_list = ""
+
+                for item in schedule_items:
+                    scheduled_list += f"{item['status']} from {item['start']['dateTime']} to {item['end']['dateTime']} EST\n"
+                schedules.append((schedule.get('scheduleId'), scheduled_list))
+            if len(schedules) == 1:
+                return schedules[0][1]
+            return "".join(f"{schedule_id}:\n{scheduled_list or 'No scheduled items'}\n" for schedule_id, scheduled_list in schedules)
         else:
             # If response.text containt "InvalidAuthenticationToken" then refresh token
             if "InvalidAuthenticationToken" in response.text:
@@ -321,7 +699,7 @@ class OutlookClient:
         self.refresh_token_if_needed()
         headers = {'Authorization': f'Bearer {self.token["access_token"]}'}
         filter_query = f"startswith(displayName,'{query}') or startswith(mail,'{query}')"
-        response = requests.get(f'https://graph.microsoft.com/v1.0/users?$filter={filter_query}', headers=headers)
+        response = http_client.get(f'https://graph.microsoft.com/v1.0/users?$filter={filter_query}', headers=headers)
         response.raise_for_status()
         return response.json()
 
@@ -329,7 +707,7 @@ class OutlookClient:
         # Requires admin consent
         self.refresh_token_if_needed()
         headers = {'Authorization': f'Bearer {self.token["access_token"]}'}
-        response = requests.get('https://graph.microsoft.com/v1.0/places/microsoft.graph.room', headers=headers)
+        response = http_client.get('https://graph.microsoft.com/v1.0/places/microsoft.graph.room', headers=headers)
         response.raise_for_status()
         return response.json()
 
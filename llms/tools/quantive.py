@@ -1,5 +1,6 @@
 import os
 import requests
+from llms.tools.http_client import http_client
 from dotenv import load_dotenv
 
 class QuantiveAPI:
@@ -27,7 +28,7 @@ class QuantiveAPI:
         headers = self._get_headers()
 
         try:
-            response = requests.get(search_endpoint, headers=headers)
+            response = http_client.get(search_endpoint, headers=headers)
         except requests.exceptions.RequestException as e:
             print(f'Error: {e}')
             return None
@@ -42,7 +43,7 @@ class QuantiveAPI:
         headers = self._get_headers()
 
         try:
-            response = requests.get(search_endpoint, headers=headers)
+            response = http_client.get(search_endpoint, headers=headers)
         except requests.exceptions.RequestException as e:
             print(f'Error: {e}')
             return None
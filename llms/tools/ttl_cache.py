@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+class TTLCache:
+    """LRU cache whose entries expire after a TTL, with an optional JSON on-disk tier.
+
+    Expired entries are kept until evicted so callers can revalidate them instead of refetching.
+    """
+    def __init__(self, name, max_entries=256, ttl=900, disk_dir=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def disk_path(self, key):
+        # The disk tier is resolved on use so SEARCH_CACHE_DIR from environment.env is honoured
+        disk_dir = self.disk_dir or os.getenv('SEARCH_CACHE_DIR')
+        if not disk_dir:
+            return None
+        return os.path.join(disk_dir, self.name, hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+    def get_entry(self, key):
+        """Return (value, fresh) for a key, or (None, False) if it isn't cached."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None:
+            entry = self.read_disk(key)
+            if entry is not None:
+                with self.lock:
+                    self.store(key, entry)
+        fresh = entry is not None and entry[0] > now
+        with self.lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            return None, False
+        return entry[1], fresh
+
+    def get(self, key):
+        """Return the value for a key if it is cached and fresh."""
+        value, fresh = self.get_entry(key)
+        return value if fresh else None
+
+    def set(self, key, value, ttl=None):
+        entry = (time.time() + (ttl or self.ttl), value)
+        with self.lock:
+            self.store(key, entry)
+        self.write_disk(key, entry)
+
+    def store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def read_disk(self, key):
+        path = self.disk_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            return data['expires_at'], data['value']
+        except Exception as e:
+            print(f"Could not read cache entry {path}: {e}")
+            return None
+
+    def write_disk(self, key, entry):
+        path = self.disk_path(key)
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'expires_at': entry[0], 'value': entry[1]}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Could not write cache entry {path}: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
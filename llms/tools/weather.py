@@ -1,27 +1,88 @@
-import requests
+from llms.tools.http_client import http_client
+from llms.tools.ttl_cache import TTLCache
+
+# Shared by every WeatherChecker; current conditions change faster than the forecast
+weather_cache = TTLCache('weather', max_entries=256, ttl=600)
+forecast_cache = TTLCache('forecast', max_entries=256, ttl=3600)
 
 class WeatherChecker:
-    def __init__(self, api_key):
+    def __init__(self, api_key, weather_cache=weather_cache, forecast_cache=forecast_cache):
         self.api_key = api_key
         self.base_url = "http://api.openweathermap.org/data/2.5/"
         self.geocode_url = "http://api.openweathermap.org/geo/1.0/direct"
+        self.weather_cache = weather_cache
+        self.forecast_cache = forecast_cache
+
+    def cache_key(self, lat, lon):
+        # Coordinates within about 1km share an entry
+        return f"{float(lat):.2f},{float(lon):.2f}"
 
     def get_weather(self, lat, lon):
+        cache_key = self.cache_key(lat, lon)
+        weather = self.weather_cache.get(cache_key)
+        if weather is not None:
+            return weather
+
         weather_url = f"{self.base_url}weather?lat={lat}&lon={lon}&appid={self.api_key}&units=imperial"
-        response = requests.get(weather_url)
+        response = http_client.get(weather_url)
         if response.status_code == 200:
-            return response.json()
+            weather = self.compact_weather(response.json())
+            self.weather_cache.set(cache_key, weather)
+            return weather
         else:
             return {"error": f"Unable to get weather data"}
 
     def get_forecast(self, lat, lon):
+        cache_key = self.cache_key(lat, lon)
+        forecast = self.forecast_cache.get(cache_key)
+        if forecast is not None:
+            return forecast
+
         forecast_url = f"{self.base_url}forecast?lat={lat}&lon={lon}&appid={self.api_key}&units=imperial"
-        response = requests.get(forecast_url)
+        response = http_client.get(forecast_url)
         if response.status_code == 200:
-            return response.json()
+            forecast = self.compact_forecast(response.json())
+            self.forecast_cache.set(cache_key, forecast)
+            return forecast
         else:
             return {"error": f"Unable to get forecast data"}
 
+    def compact_weather(self, data):
+        """Keep only the fields an answer needs from a current weather response."""
+        main = data.get('main', {})
+        wind = data.get('wind', {})
+        return {
+            "location": data.get('name'),
+            "time": data.get('dt'),
+            "timezone_offset": data.get('timezone'),
+            "conditions": ', '.join(w.get('description', '') for w in data.get('weather', [])),
+            "temp_f": main.get('temp'),
+            "feels_like_f": main.get('feels_like'),
+            "temp_min_f": main.get('temp_min'),
+            "temp_max_f": main.get('temp_max'),
+            "humidity": main.get('humidity'),
+            "wind_mph": wind.get('speed'),
+            "wind_deg": wind.get('deg'),
+            "sunrise": data.get('sys', {}).get('sunrise'),
+            "sunset": data.get('sys', {}).get('sunset')
+        }
+
+    def compact_forecast(self, data):
+        """Keep only the fields an answer needs from each 3-hour forecast step."""
+        city = data.get('city', {})
+        return {
+            "location": city.get('name'),
+            "timezone_offset": city.get('timezone'),
+            "forecast": [{
+                "time": step.get('dt_txt'),
+                "conditions": ', '.join(w.get('description', '') for w in step.get('weather', [])),
+                "temp_f": step.get('main', {}).get('temp'),
+                "humidity": step.get('main', {}).get('humidity'),
+                "wind_mph": step.get('wind', {}).get('speed'),
+                "precipitation_chance": step.get('pop')
+            } for step in data.get('list', [])]
+        }
+
 # Test Cell
 # Please do not modify
 if __name__ == "__main__":
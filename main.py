@@ -2,9 +2,12 @@ import os
 import logging
 import signal
 from dotenv import load_dotenv
-from quart import Quart, render_template, request, jsonify, session, redirect, url_for
+from quart import Quart, Response, render_template, request, jsonify, session, redirect, url_for
 from llm_manager import LLMManager
 from logger import Logger
+from user_store import UserStore
+from llms.tools.http_client import http_client
+from llms.tools.mail_store import MailStore
 import json
 import asyncio
 from functools import partial
@@ -23,6 +26,7 @@ app.secret_key = os.getenv('SECRET_KEY')
 app.debug = False
 llm_manager = LLMManager()
 llm_logger = Logger()
+user_store = UserStore()
 
 # Set the log level to WARNING to suppress HTTP request logs
 log = logging.getLogger('werkzeug')
@@ -31,6 +35,11 @@ log.setLevel(logging.WARNING)
 # Global flag to track shutdown state
 is_shutting_down = False
 
+@app.before_serving
+async def start_background_tasks():
+    # Delete stale assistants and warm up LLMs in the background so they don't hold up server start
+    await llm_manager.start_background_tasks()
+
 async def cleanup():
     """Cleanup function to be called during shutdown"""
     global is_shutting_down
@@ -39,7 +48,7 @@ async def cleanup():
     print("Starting cleanup process...")
     
     # Clean up each LLM instance
-    for llm_name, llm in llm_manager.llms.items():
+    for llm_name, llm in list(llm_manager.llms.items()):
         try:
             # Handle async cleanup for realtime LLMs
             if llm_name in llm_manager.async_llms:
@@ -85,30 +94,24 @@ def handle_shutdown(signum, frame):
     # Stop the event loop after cleanup
     loop.stop()
 
-def load_users():
-    with open('users.json') as f:
-        return json.load(f)['users']
-
 def clear_outlook_pickles():
-    # Search app root for any pickle files matching *_365_token.pickle and delete them
+    # Search app root for any pickle files matching *_365_token.pickle and delete them,
+    # along with the local mail stores (*_mail_store.db) that hold copies of users' mailboxes
     for root, dirs, files in os.walk(os.getcwd()):
         for file in files:
             if file.endswith("_365_token.pickle"):
                 os.remove(os.path.join(root, file))
-
-def get_user_by_username(username):
-    users = load_users()
-    return next((user for user in users if user['username'] == username), None)
+            elif file.endswith("_mail_store.db"):
+                MailStore.remove(os.path.join(root, file))
 
 @app.route('/')
 async def index():
     if 'username' in session:
         llms = llm_manager.get_available_llms()
         # Limit LLMs to only those that the user is authorized to use
-        user = get_user_by_username(session['username'])
-        if user:
-            llms = [llm for llm in llms if llm in user['authorized_llms']]
-            is_admin = user.get('type') == 'admin'
+        username = session['username']
+        llms = [llm for llm in llms if user_store.is_authorized(username, llm)]
+        is_admin = user_store.is_admin(username)
 
         llm_links = llm_manager.get_llm_links()
         #capitalize the first letter of the username
@@ -120,7 +123,7 @@ async def index():
 async def get_authorized_llms():
     data = await request.get_json()
     username = session['username']
-    user = get_user_by_username(username)
+    user = user_store.get_user(username)
     
     if user:
         return jsonify({"authorized_llms": user['authorized_llms']})
@@ -133,12 +136,10 @@ async def login():
     #ensure usernames are lowercase
     username = data['username'].lower()
     password = data['password']
-    users = load_users()
     
-    for user in users:
-        if user['username'] == username and user['password'] == password:
-            session['username'] = username
-            return jsonify(success=True)
+    if user_store.check_password(username, password):
+        session['username'] = username
+        return jsonify(success=True)
     return jsonify(success=False)
 
 @app.route('/is_logged_in')
@@ -149,7 +150,10 @@ async def is_logged_in():
 
 @app.route('/logout')
 async def logout():
-    session.pop('username', None)
+    username = session.pop('username', None)
+    if username:
+        # Don't leave a copy of the user's mailbox on disk after they log out
+        MailStore.clear_user(username)
     return '', 204  # No content response
 
 @app.route('/generate', methods=['POST'])
@@ -170,7 +174,7 @@ async def generate():
         response = await llm_manager.get_llm_response(llm_name, user, prompt)
         
         # Get any extra messages
-        llm = llm_manager.get_llm(llm_name)
+        llm = await llm_manager.load_llm(llm_name)
         extra_messages = llm.get_extra_messages(user) if hasattr(llm, 'get_extra_messages') else []
 
         # Log the response
@@ -186,10 +190,51 @@ async def generate():
         llm_logger.log_error(user, llm_name, error_message)
         return jsonify({'error': error_message})
 
+@app.route('/generate_stream', methods=['POST'])
+async def generate_stream():
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'})
+
+    data = await request.get_json()
+    llm_name = data.get('llm')
+    prompt = data.get('prompt')
+    user = session['username']
+
+    # Log the request
+    llm_logger.log_request(user, llm_name, prompt)
+
+    async def events():
+        # Send each chunk as a server-sent event as soon as the LLM produces it
+        response = ''
+        try:
+            async for chunk in llm_manager.get_llm_response_stream(llm_name, user, prompt):
+                if not chunk:
+                    continue
+                response += chunk
+                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+
+            # Get any extra messages
+            llm = await llm_manager.load_llm(llm_name)
+            extra_messages = llm.get_extra_messages(user) if hasattr(llm, 'get_extra_messages') else []
+
+            # Log the response
+            llm_logger.log_response(user, llm_name, response)
+
+            yield f"data: {json.dumps({'done': True, 'extra_messages': extra_messages})}\n\n"
+        except Exception as e:
+            error_message = f"Error generating response: {str(e)}"
+            llm_logger.log_error(user, llm_name, error_message)
+            yield f"data: {json.dumps({'error': error_message})}\n\n"
+
+    response = Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    # Long generations must not be cut off by the default response timeout
+    response.timeout = None
+    return response
+
 @app.route('/extra_messages', methods=['GET'])
 async def get_extra_messages():
     llm_name = request.args.get('llm')
-    llm = llm_manager.get_llm(llm_name)
+    llm = await llm_manager.load_llm(llm_name)
     user = session['username']
     if llm:
         messages = llm.get_extra_messages(user)
@@ -197,13 +242,36 @@ async def get_extra_messages():
     else:
         return jsonify({'error': 'LLM not found'}), 404
 
+@app.route('/extra_messages_stream', methods=['GET'])
+async def extra_messages_stream():
+    if 'username' not in session:
+        # A status error (not a JSON body) tells the EventSource to stop reconnecting
+        return '', 401
+
+    user = session['username']
+    queue = llm_manager.message_bus.subscribe(user)
+
+    async def events():
+        # Push extra messages from every LLM as they are added instead of waiting for a poll
+        try:
+            while True:
+                message = await queue.get()
+                yield f"data: {json.dumps(message)}\n\n"
+        finally:
+            llm_manager.message_bus.unsubscribe(user, queue)
+
+    response = Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    # The stream stays open for as long as the page is
+    response.timeout = None
+    return response
+
 @app.route('/summarize_thread', methods=['POST'])
 async def summarize_thread():
     data = await request.get_json()
     llm_name = data['llm']
     user = session['username']
     try:
-        llm = llm_manager.get_llm(llm_name)
+        llm = await llm_manager.load_llm(llm_name)
         thread = await llm.summarize_conversation(user)
         return jsonify({'thread': thread}), 200
     except Exception as e:
@@ -216,7 +284,7 @@ async def check_conversation():
     llm_name = data['llm']
     user = session['username']
     try:
-        llm = llm_manager.get_llm(llm_name)
+        llm = await llm_manager.load_llm(llm_name)
         has_conversation = llm.check_for_previous_conversation(user)
         return jsonify({'has_conversation': has_conversation}), 200
     except:
@@ -228,18 +296,24 @@ async def clear_thread():
     llm_name = data['llm']
     user = session['username']
     try:
-        llm = llm_manager.get_llm(llm_name)
+        llm = await llm_manager.load_llm(llm_name)
         await llm.clear_conversation(user)
         return jsonify({'status': 'success'}), 200
     except Exception as e:
         print(e)
         return jsonify({'status': 'error', 'message': 'Error clearing thread'}), 500
 
+@app.route('/http_stats')
+async def http_stats():
+    # Only allow admin users to view connection pool statistics
+    if not user_store.is_admin(session.get('username', '')):
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    return jsonify(http_client.stats())
+
 @app.route('/shutdown', methods=['POST'])
 async def shutdown():
     # Only allow admin users to shutdown
-    user = get_user_by_username(session.get('username', ''))
-    if not user or user.get('type') != 'admin':
+    if not user_store.is_admin(session.get('username', '')):
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
         
     print("Shutdown requested by admin user")
@@ -27,6 +27,8 @@ function checkLoginStatus() {
                 document.getElementById('app-content').classList.remove('hidden');
                 document.getElementById('main-content').style.display = 'flex';
                 adjustLayout(); // Call adjustLayout here to ensure proper rendering
+                // Receive extra messages for all LLMs as they are pushed
+                listenExtraMessages();
             } else {
                 document.getElementById('login-form').classList.remove('hidden');
                 document.getElementById('header').classList.add('hidden');
@@ -69,6 +71,7 @@ function logout() {
     fetch('/logout')
         .then(response => {
             if (response.ok) {
+                stopExtraMessages();
                 document.getElementById('login-form').classList.remove('hidden');
                 document.getElementById('header').classList.add('hidden');
                 document.getElementById('app-content').classList.add('hidden');
@@ -126,17 +129,7 @@ function summarizeThread(llm) {
     .then(thread => thread.json())
     .then(data => {
         // Process the thread and separate code blocks from plain text
-        const parts = data.thread.split(/(```[\s\S]*?```)/g); // Split by code blocks
-        let formattedThread = '';
-
-        parts.forEach(part => {
-            if (part.startsWith('```') && part.endsWith('```')) {
-                const codeBlock = part.slice(3, -3).replace(/\n/g, '<br>');
-                formattedThread += `<pre><code>${codeBlock}</code></pre>`;
-            } else {
-                formattedThread += part.replace(/\n/g, '<br>');
-            }
-        });
+        const formattedThread = formatResponse(data.thread);
 
         const llmResponse = `<strong>${llm}:</strong><br>${formattedThread}<br>`;
         outputDiv.innerHTML = `${llmResponse}`;
@@ -155,7 +148,24 @@ function summarizeThread(llm) {
     });
 }
 
-// Function to generate response from LLM
+// Function to format a response, separating code blocks from plain text
+function formatResponse(text) {
+    const parts = text.split(/(```[\s\S]*?```)/g); // Split by code blocks
+    let formattedResponse = '';
+
+    parts.forEach(part => {
+        if (part.startsWith('```') && part.endsWith('```')) {
+            const codeBlock = part.slice(3, -3).replace(/\n/g, '<br>');
+            formattedResponse += `<pre><code>${codeBlock}</code></pre>`;
+        } else {
+            formattedResponse += part.replace(/\n/g, '<br>');
+        }
+    });
+
+    return formattedResponse;
+}
+
+// Function to generate response from LLM, rendering tokens as they are streamed
 function generateResponse(llm) {
     const input = document.getElementById(`${llm}-input`).value;
     const outputDiv = document.getElementById(`${llm}-output`);
@@ -179,41 +189,72 @@ function generateResponse(llm) {
     const signal = controller.signal;
     ongoingRequests[llm] = controller;
 
-    fetch('/generate', {
+    const userPrompt = `<strong>User:</strong> ${input.replace(/\n/g, '<br>')}<br><br>`;
+    const responseDiv = document.createElement('div');
+    outputDiv.prepend(responseDiv);
+
+    let responseText = '';
+    const renderResponse = (label) => {
+        responseDiv.innerHTML = `<hr><strong>${label}:</strong><br>${formatResponse(responseText)}<br><hr><i>${userPrompt}</i>`;
+    };
+    renderResponse(llm);
+
+    const finishResponse = () => {
+        clearInterval(timerInterval);
+        delete ongoingRequests[llm];
+        spinner.style.visibility = 'hidden';
+        toggleSpinner.style.visibility = 'hidden';
+        timer.style.display = 'none';
+    };
+
+    fetch('/generate_stream', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
         body: JSON.stringify({ llm: llm, prompt: input }),
+        signal: signal,
     })
-    .then(response => response.json())
-    .then(data => {
-        clearInterval(timerInterval);
-        delete ongoingRequests[llm];
-        let elapsedTime = (new Date() - startTime) / 1000;
-        
-        // Process the response and separate code blocks from plain text
-        const parts = data.response.split(/(```[\s\S]*?```)/g); // Split by code blocks
-        let formattedResponse = '';
-
-        parts.forEach(part => {
-            if (part.startsWith('```') && part.endsWith('```')) {
-                const codeBlock = part.slice(3, -3).replace(/\n/g, '<br>');
-                formattedResponse += `<pre><code>${codeBlock}</code></pre>`;
-            } else {
-                formattedResponse += part.replace(/\n/g, '<br>');
-            }
-        });
-
-        const userPrompt = `<strong>User:</strong> ${input.replace(/\n/g, '<br>')}<br><br>`;
-        const llmResponse = `<strong>${llm} (${elapsedTime.toFixed(3)}s):</strong><br>${formattedResponse}<br>`;
+    .then(async response => {
+        // Errors before streaming starts come back as plain JSON
+        if (!(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+            const data = await response.json();
+            responseText = data.error || data.response || '';
+            return;
+        }
 
-        outputDiv.innerHTML = `<hr>${llmResponse}<hr><i>${userPrompt}</i>` + outputDiv.innerHTML;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
 
-        clearInterval(timerInterval);
-        spinner.style.visibility = 'hidden';
-        toggleSpinner.style.visibility = 'hidden';
-        timer.style.display = 'none';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            // Server-sent events are separated by a blank line
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            events.forEach(event => {
+                if (!event.startsWith('data: ')) {
+                    return;
+                }
+                const data = JSON.parse(event.slice(6));
+                if (data.delta) {
+                    responseText += data.delta;
+                } else if (data.error) {
+                    responseText += data.error;
+                }
+            });
+            renderResponse(llm);
+        }
+    })
+    .then(() => {
+        let elapsedTime = (new Date() - startTime) / 1000;
+        renderResponse(`${llm} (${elapsedTime.toFixed(3)}s)`);
+        finishResponse();
     })
     .catch((error) => {
         if (error.name === 'AbortError') {
@@ -223,12 +264,7 @@ function generateResponse(llm) {
         }
         const errorResponse = 'An error occurred';
         outputDiv.innerHTML = `<hr><div>${errorResponse}</div>` + outputDiv.innerHTML;
-
-        spinner.style.visibility = 'hidden';
-        toggleSpinner.style.visibility = 'hidden';
-        timer.style.display = 'none';
-        clearInterval(timerInterval);
-        delete ongoingRequests[llm];
+        finishResponse();
     });
 }
 
@@ -322,38 +358,47 @@ function toggleLLM(llm) {
     });
 }
 
-// Function to poll for extra messages
-function pollExtraMessages(llm) {
-    const outputDiv = document.getElementById(`${llm}-output`);
+let extraMessagesSource = null;
 
-    fetch(`/extra_messages?llm=${llm}`)
-        .then(response => response.json())
-        .then(data => {
-            if (data.messages) {
-                data.messages.forEach(message => {
-                    const messageDiv = document.createElement('div');
-                    messageDiv.innerHTML = message;
-                    outputDiv.prepend(messageDiv);  // Prepend to show the latest message on top
-                });
-            }
-        })
-        .catch(error => {
-            console.error('Error fetching extra messages:', error);
-        });
+// Function to receive extra messages
+function listenExtraMessages() {
+    if (extraMessagesSource) {
+        return;
+    }
+    // One stream carries the extra messages of every LLM; the browser reconnects automatically
+    const source = new EventSource('/extra_messages_stream');
+    extraMessagesSource = source;
+
+    source.onmessage = event => {
+        const data = JSON.parse(event.data);
+        const outputDiv = document.getElementById(`${data.llm}-output`);
+        if (!outputDiv) {
+            return;
+        }
+        const messageDiv = document.createElement('div');
+        messageDiv.innerHTML = data.message;
+        outputDiv.prepend(messageDiv);  // Prepend to show the latest message on top
+    };
+
+    source.onerror = error => {
+        console.error('Error receiving extra messages:', error);
+        if (source.readyState === EventSource.CLOSED && extraMessagesSource === source) {
+            // The server refused the stream, e.g. after the session expired
+            extraMessagesSource = null;
+        }
+    };
+}
 
-    // Continue polling
-    setTimeout(() => pollExtraMessages(llm), 2000);
+function stopExtraMessages() {
+    if (extraMessagesSource) {
+        extraMessagesSource.close();
+        extraMessagesSource = null;
+    }
 }
 
 window.addEventListener('resize', adjustLayout);
 document.addEventListener('DOMContentLoaded', function() {
     checkLoginStatus();
-    // Add polling for each LLM
-    const llms = document.querySelectorAll('.llm-block');
-    llms.forEach(llm => {
-        const llmId = llm.id.split('-')[0];
-        pollExtraMessages(llmId);
-    });
 });
 
 function confirmShutdown() {
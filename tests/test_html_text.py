@@ -0,0 +1,45 @@
+import pytest
+
+html_text = pytest.importorskip('llms.tools.html_text')
+
+# Confluence storage format for a page with a code macro and a no-format macro
+STORAGE_FORMAT = '''<p>Deploy with the script below.</p>
+<ac:structured-macro ac:name="code" ac:schema-version="1">
+  <ac:parameter ac:name="language">bash</ac:parameter>
+  <ac:plain-text-body><![CDATA[./deploy.sh --env prod && echo "done" < /dev/null]]></ac:plain-text-body>
+</ac:structured-macro>
+<ac:structured-macro ac:name="noformat" ac:schema-version="1">
+  <ac:plain-text-body><![CDATA[Expected output:
+  deployed 3 services]]></ac:plain-text-body>
+</ac:structured-macro>'''
+
+def backends():
+    # Every parser backend available here, selected the way html_to_text picks them
+    available = [('soup', None, None)]
+    if html_text.lxml is not None:
+        available.append(('lxml', None, html_text.lxml))
+    if html_text.HTMLParser is not None:
+        available.append(('selectolax', html_text.HTMLParser, html_text.lxml))
+    return available
+
+@pytest.fixture(params=backends(), ids=lambda backend: backend[0])
+def backend(request, monkeypatch):
+    name, parser, lxml = request.param
+    monkeypatch.setattr(html_text, 'HTMLParser', parser)
+    monkeypatch.setattr(html_text, 'lxml', lxml)
+    return name
+
+def test_confluence_macro_bodies_are_kept(backend):
+    text = html_text.html_to_text(STORAGE_FORMAT, main_content=False)
+    assert 'Deploy with the script below.' in text
+    assert './deploy.sh --env prod && echo "done" < /dev/null' in text
+    assert 'deployed 3 services' in text
+
+def test_main_content_follows_selector_order(backend):
+    # An <article> comes first in the document, but <main> is preferred
+    article = 'article text ' * 30
+    main = 'main text ' * 30
+    html = f'<html><body><article>{article}</article><main>{main}</main></body></html>'
+    text = html_text.html_to_text(html)
+    assert 'main text' in text
+    assert 'article text' not in text
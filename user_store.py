@@ -0,0 +1,44 @@
+import json
+import os
+
+class UserStore:
+    def __init__(self, path='users.json'):
+        self.path = path
+        self.mtime = None
+        self.users = {}
+        self.authorized_llms = {}
+
+    def _refresh(self):
+        """Reload users.json only if it has changed since it was last read."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime:
+            return
+
+        users = {}
+        if mtime is not None:
+            with open(self.path) as f:
+                for user in json.load(f)['users']:
+                    users[user['username']] = user
+        self.users = users
+        # Precompute authorized LLM sets so authorization checks don't scan lists
+        self.authorized_llms = {username: set(user.get('authorized_llms', [])) for username, user in users.items()}
+        self.mtime = mtime
+
+    def get_user(self, username):
+        self._refresh()
+        return self.users.get(username)
+
+    def check_password(self, username, password):
+        user = self.get_user(username)
+        return user is not None and user['password'] == password
+
+    def is_authorized(self, username, llm_name):
+        self._refresh()
+        return llm_name in self.authorized_llms.get(username, ())
+
+    def is_admin(self, username):
+        user = self.get_user(username)
+        return user is not None and user.get('type') == 'admin'